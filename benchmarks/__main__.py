@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from argparse import ArgumentParser
+from gettext import gettext as _
+from queue import Empty
+
+from benchmarks import corpus
+from benchmarks.scenarios import SCENARIOS, get_config, run_scenario
+from benchmarks.server import StandInServer
+from we1schomp import data
+
+RESULTS_FILENAME = os.path.join(os.path.dirname(__file__), 'results.jsonl')
+
+
+def run():
+    """
+    """
+
+    parser = ArgumentParser(description=_(
+        'Benchmark WE1S Chomp against a synthetic corpus served locally.'))
+
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000],
+                        help=_('Number of files already in the output '
+                               'folder for each round.'))
+    parser.add_argument('--batch', type=int, default=500,
+                        help=_('Number of articles each scenario handles.'))
+    parser.add_argument('--scenarios', type=str, nargs='+',
+                        choices=list(SCENARIOS), default=list(SCENARIOS),
+                        help=_('Scenarios to run, in order.'))
+    parser.add_argument('--settings-file', type=str, default='settings.ini',
+                        help=_('Settings to start from.'))
+    parser.add_argument('--results-file', type=str,
+                        default=RESULTS_FILENAME,
+                        help=_('Where to keep results between runs.'))
+    parser.add_argument('--keep', action='store_true',
+                        help=_('Keep the output folders afterwards.'))
+
+    args = parser.parse_args()
+
+    server = StandInServer(serp_results=args.batch, wp_posts=args.batch)
+    server.start()
+    results = []
+
+    try:
+        for size in args.sizes:
+            path = tempfile.mkdtemp(prefix='we1schomp_bench_')
+            try:
+                results += run_size(size, path, server.host, args)
+            finally:
+                if args.keep:
+                    print(_('Kept: %s') % path)
+                else:
+                    shutil.rmtree(path, ignore_errors=True)
+    finally:
+        server.close()
+
+    previous = load_previous(args.results_file, args.batch)
+    save_results(args.results_file, args.batch, results)
+    print_results(results, previous)
+
+
+def run_size(size, path, host, args):
+    """
+    """
+
+    print(_('\nFilling output folder with %s files...') % size)
+    config = get_config(args.settings_file, path, host)[0]
+    corpus.make_output_dir(config['OUTPUT_PATH'], size)
+
+    # Building the index from scratch is what an upgrade or --rebuild-index
+    # costs, so it's worth knowing how that grows too.
+    start = time.perf_counter()
+    data.OutputIndex(config['OUTPUT_PATH'], config['OUTPUT_FILENAME'],
+                     config['OUTPUT_INDEX_FILENAME'])
+    index_rebuild = time.perf_counter() - start
+
+    # Fresh interpreters, not forks, so none of this process's memory gets
+    # counted against the scenario.
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    results = []
+    for scenario in args.scenarios:
+        print(_('Running %s...') % scenario)
+        process = context.Process(target=run_scenario, args=(
+            scenario, size, path, host, args.settings_file, args.batch,
+            queue))
+        process.start()
+
+        # If the scenario falls over there'll be no result coming.
+        while True:
+            try:
+                result = queue.get(timeout=1.0)
+                break
+            except Empty:
+                if not process.is_alive():
+                    raise RuntimeError(_('Scenario failed: %s') % scenario)
+        process.join()
+        result['index_rebuild'] = round(index_rebuild, 4)
+        results.append(result)
+    return results
+
+
+def load_previous(filename, batch):
+    """
+    """
+
+    # Compare against the last run that did the same amount of work.
+    if not os.path.exists(filename):
+        return None
+    previous = None
+    with open(filename, 'r', encoding='utf-8') as infile:
+        for line in infile:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('batch') == batch:
+                previous = record
+    return previous
+
+
+def save_results(filename, batch, results):
+    """
+    """
+
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    record = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': commit,
+        'python': platform.python_version(), 'platform': platform.platform(),
+        'batch': batch, 'results': results
+    }
+    with open(filename, 'a', encoding='utf-8') as outfile:
+        outfile.write(json.dumps(record) + '\n')
+    print(_('\nResults saved to %s.') % filename)
+
+
+def print_results(results, previous):
+    """
+    """
+
+    before = {}
+    if previous is not None:
+        print(_('Comparing with %s (%s).') % (
+            previous['time'], previous['commit']))
+        before = {(x['size'], x['scenario']): x['per_sec']
+                  for x in previous['results']}
+
+    print('\n{:>8} {:<10} {:>8} {:>9} {:>8} {:>8} {:>8} {:>9} {:>11} '
+          '{:>8}'.format(
+              _('Files'), _('Scenario'), _('Count'), _('Per sec'), _('p50'),
+              _('p99'), _('Peak MB'), _('Index (s)'), _('Rebuild (s)'),
+              _('Change')))
+    for result in results:
+        change = ''
+        old = before.get((result['size'], result['scenario']))
+        if old and result['per_sec']:
+            change = '{:+.1f}%'.format(
+                (result['per_sec'] - old) / old * 100)
+        print('{:>8} {:<10} {:>8} {:>9} {:>8} {:>8} {:>8} {:>9} {:>11} '
+              '{:>8}'.format(
+                  result['size'], result['scenario'], result['articles'],
+                  result['per_sec'], _format(result['p50']),
+                  _format(result['p99']), _format(result['peak_mb']),
+                  result['index_load'],
+                  _format(result.get('index_rebuild')), change))
+
+
+def _format(value):
+    """
+    """
+
+    return '-' if value is None else value
+
+
+if __name__ == '__main__':
+    run()
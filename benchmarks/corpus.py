@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import html
+import json
+import os
+import random
+from urllib.parse import quote_plus
+from zlib import crc32
+
+# Enough vocabulary that the text doesn't compress or clean unrealistically
+# well, with some of the punctuation and entities real pages are full of.
+WORDS = '''
+the of and to in a is that for it as was with be by on not he this are or
+his from at which but have an they you were her she there been one all we
+their has would when who will more if no out so said what up its about
+into than them can only other new some could time these two may then do
+first any my now such like our over man me even most made after also did
+many before must through back years where much your way well down should
+because each just those people how too little state good very make world
+still own see men work long get here between both life being under never
+day same another know while last might us great old year off come since
+against go came right used take three humanities liberal arts university
+college students faculty research teaching scholarship culture history
+literature philosophy languages criticism public value crisis funding
+degree major careers learning education interdisciplinary digital media
+'''.split()
+PUNCTUATION = ['.', '.', '.', ',', ',', ';', ':', '!', '?', ' &amp;',
+               ' &mdash;', '&rsquo;s', ' &ldquo;', '&rdquo;', ' (', ')']
+
+
+def get_random(*seed):
+    """
+    """
+
+    # The same seed always gives the same page, so pages can be made up on
+    # demand without being stored anywhere.
+    return random.Random(crc32(repr(seed).encode('utf-8')))
+
+
+def make_words(rng, count):
+    """
+    """
+
+    words = []
+    for i in range(count):
+        word = rng.choice(WORDS)
+        if rng.random() < 0.08:
+            word += rng.choice(PUNCTUATION)
+        words.append(word)
+    return ' '.join(words).capitalize() + '.'
+
+
+def make_title(rng):
+    """
+    """
+
+    return make_words(rng, rng.randint(4, 10)).rstrip('.').title()
+
+
+def make_article_html(article_id):
+    """
+    """
+
+    rng = get_random('article', article_id)
+    title = make_title(rng)
+
+    # Real pages carry far more navigation, scripts and sidebar than they
+    # do article, and that's most of what the parser has to get through.
+    nav = ''.join(
+        '<li class="menu-item"><a href="/section/{0}">{1}</a></li>'.format(
+            i, html.escape(make_words(rng, 2))) for i in range(120))
+    sidebar = ''.join(
+        '<div class="widget"><h3>{0}</h3><p>{1}</p></div>'.format(
+            html.escape(make_title(rng)), make_words(rng, 8))
+        for i in range(20))
+    paragraphs = ''.join(
+        '<p>{0} <a href="https://example.org/{1}">{2}</a> {3}</p>'.format(
+            make_words(rng, rng.randint(30, 90)), i, make_words(rng, 3),
+            make_words(rng, rng.randint(10, 40)))
+        for i in range(rng.randint(6, 20)))
+    captions = ''.join(
+        '<figure><img src="/img/{0}.jpg"><figcaption><p>{1}</p>'
+        '</figcaption></figure>'.format(i, make_words(rng, 6))
+        for i in range(3))
+
+    return '''<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>{title}</title>
+<script>window.dataLayer = window.dataLayer || []; function gtag() {{
+dataLayer.push(arguments); }} gtag('js', new Date());</script>
+<style>body {{ font-family: serif; }} .menu-item {{ display: inline; }}
+</style></head>
+<body><header><nav><ul>{nav}</ul></nav>
+<p>{tagline}</p></header>
+<div id="main"><article><h1>{title}</h1>
+<p class="byline">By {author} | January {day}, 2018</p>
+{captions}{paragraphs}</article>
+<aside>{sidebar}</aside></div>
+<footer><p>{footer}</p><ul>{nav}</ul></footer>
+<script src="/js/app.js"></script></body></html>'''.format(
+        title=html.escape(title), nav=nav,
+        tagline=make_words(rng, 20), author=make_title(rng),
+        day=rng.randint(1, 31), captions=captions, paragraphs=paragraphs,
+        sidebar=sidebar, footer=make_words(rng, 30))
+
+
+def make_serp_html(base_url, query, start, total, per_page=10):
+    """
+    """
+
+    # Just enough of a Google results page for get_serp_results: results in
+    # <div class="rc">, dates in <span class="f">, and a "Next" link.
+    results = []
+    for i in range(start, min(start + per_page, total)):
+        rng = get_random('serp', query, i)
+        results.append(
+            '<div class="g"><div class="rc"><h3 class="r"><a href="{url}">'
+            '{title}</a></h3><div class="s"><span class="st"><span class="f">'
+            'Jan {day}, 2018 - </span>{snippet}</span></div></div></div>'
+            .format(url='{}/article/{}-{}'.format(
+                        base_url, crc32(query.encode('utf-8')), i),
+                    title=html.escape(make_title(rng)),
+                    day=rng.randint(1, 31),
+                    snippet=make_words(rng, 25)))
+
+    next_link = ''
+    if start + per_page < total:
+        next_link = '<a id="pnnext" href="/search?q={}&amp;start={}">' \
+                    'Next</a>'.format(quote_plus(query), start + per_page)
+
+    return '''<!DOCTYPE html><html><head><title>{query} - Google Search
+</title></head><body><div id="search"><div id="ires">{results}</div></div>
+<div id="foot">{next_link}</div></body></html>'''.format(
+        query=html.escape(query), results=''.join(results),
+        next_link=next_link)
+
+
+def make_wp_post(base_url, post_id):
+    """
+    """
+
+    rng = get_random('post', post_id)
+    title = make_title(rng)
+    slug = '-'.join(title.lower().split())[:60]
+    paragraphs = ''.join('<p>{}</p>\n'.format(
+        make_words(rng, rng.randint(30, 120)))
+        for i in range(rng.randint(4, 16)))
+    return {
+        'id': post_id,
+        'date': '2018-01-{:02d}T12:00:00'.format(rng.randint(1, 28)),
+        'modified': '2018-02-{:02d}T12:00:00'.format(rng.randint(1, 28)),
+        'slug': slug,
+        'link': '{}/{}/'.format(base_url, slug),
+        'title': {'rendered': html.escape(title)},
+        'content': {'rendered': paragraphs, 'protected': False}
+    }
+
+
+def make_output_dir(path, count, sites=10):
+    """
+    """
+
+    # Fill an output folder the way a long-running project would, without
+    # going through save_article, so setting up a big one doesn't take as
+    # long as the benchmark itself.
+    os.makedirs(path, exist_ok=True)
+    for i in range(count):
+        rng = get_random('stored', i)
+        site = 'stored{}'.format(i % sites)
+        title = make_title(rng)
+        content = make_words(rng, rng.randint(100, 300))
+        article = {
+            'doc_id': '00000000-0000-4000-8000-{:012d}'.format(i),
+            'attachment_id': '',
+            'namespace': 'we1sv2.0',
+            'name': 'we1schomp_humanities_{}_{}'.format(
+                site, '-'.join(title.lower().split())),
+            'metapath': 'Corpus,{},Rawdata'.format(site),
+            'pub': site.title(),
+            'pub_date': 'Jan 1, 2018',
+            'pub_short': site,
+            'title': title,
+            'url': 'http://{}.example.com/{}/'.format(site, i),
+            'content': content,
+            'length': '{} words'.format(len(content.split(' '))),
+            'search_term': 'humanities'
+        }
+        filename = 'we1schomp_{}_humanities_20180101_{}.json'.format(site, i)
+        with open(os.path.join(path, filename), 'w',
+                  encoding='utf-8') as outfile:
+            json.dump(article, outfile, ensure_ascii=False, indent=2)
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import logging
+import os
+import sys
+import time
+from configparser import SafeConfigParser
+
+from benchmarks import corpus
+from benchmarks.server import FakeDriver
+from we1schomp import data, metrics, settings
+from we1schomp.article import Article
+from we1schomp.browser import Browser
+from we1schomp.fetch import FetchEngine
+from we1schomp.scrape import google, wordpress
+from we1schomp.state import CrawlState
+
+SITE_NAME = 'bench'
+
+
+def get_config(settings_file, path, host):
+    """
+    """
+
+    # Start from the real settings, so the benchmark sees the same parsers,
+    # stopwords and so on as a real run, then point everything at the
+    # stand-in server and take out the politeness delays.
+    parser = SafeConfigParser()
+    if not parser.read(settings_file):
+        raise FileNotFoundError(settings_file)
+    for section in parser.sections():
+        parser.remove_section(section)
+    parser[SITE_NAME] = {'name': 'Benchmark', 'site': host}
+
+    config = settings.get_settings(parser)
+    config.update({
+        'OUTPUT_PATH': os.path.join(path, 'output'),
+        'PAUSE_ON_EXIT': False,
+        'WAIT_FOR_KEYPRESS': False,
+        'SANITY_SLEEP': 0.0, 'SLEEP_MIN': 0.0, 'SLEEP_MAX': 0.0,
+        'BROWSER_POOL_SIZE': 0,
+        'FETCH_CONCURRENCY_PER_HOST': config['FETCH_CONCURRENCY'],
+        'RATE_DELAY_START': 0.0, 'RATE_DELAY_MIN': 0.0,
+        'RATE_DELAY_MAX': 0.0,
+        'CACHE_ENABLE': False, 'CACHE_PATH': os.path.join(path, 'cache'),
+        'METRICS_PROMETHEUS_FILE': '', 'METRICS_JSON_FILE': '',
+        'WORDPRESS_SYNC_ENABLE': False,
+        'GOOGLE_QUERY_URL':
+            'http://' + host + '/search?q={term}+site%3A{site}',
+    })
+    site = next(settings.get_sites(parser))
+    site['terms'] = ['humanities']
+    return config, site
+
+
+def save_articles(site, config, batch):
+    """
+    """
+
+    # The data layer on its own: articles that are ready to go, straight
+    # into save_article.
+    articles = []
+    for i in range(batch):
+        rng = corpus.get_random('save', i)
+        title = corpus.make_title(rng)
+        content = corpus.make_words(rng, rng.randint(100, 600))
+        articles.append(Article(
+            url='http://{}/saved/{}'.format(site['url'], i), title=title,
+            pub=site['name'], pub_short=site['short_name'],
+            pub_date='Jan 1, 2018', search_term='humanities',
+            content=content, config=config))
+    return articles
+
+
+def get_serp_articles(site, config, batch):
+    """
+    """
+
+    fetcher = FetchEngine(settings=config)
+    browser = Browser(settings=config, driver_factory=FakeDriver,
+                      limiter=fetcher.limiter)
+    state = CrawlState(os.path.join(
+        config['OUTPUT_PATH'], config['STATE_FILENAME']))
+    try:
+        yield from google.get_urls(site, config, browser, state)
+    finally:
+        state.close()
+        browser.close()
+        fetcher.close()
+
+
+def get_content_articles(site, config, batch):
+    """
+    """
+
+    # Picks up the articles the "serp" scenario left without content.
+    fetcher = FetchEngine(settings=config)
+    browser = Browser(settings=config, driver_factory=FakeDriver,
+                      limiter=fetcher.limiter)
+    state = CrawlState(os.path.join(
+        config['OUTPUT_PATH'], config['STATE_FILENAME']))
+    try:
+        yield from google.get_content(site, config, browser, fetcher, state)
+    finally:
+        state.close()
+        browser.close()
+        fetcher.close()
+
+
+def get_wordpress_articles(site, config, batch):
+    """
+    """
+
+    fetcher = FetchEngine(settings=config)
+    try:
+        if wordpress.check_for_api(site, config, fetcher):
+            yield from wordpress.get_articles(site, config, fetcher)
+    finally:
+        fetcher.close()
+
+
+SCENARIOS = {
+    'save': save_articles,
+    'serp': get_serp_articles,
+    'content': get_content_articles,
+    'wordpress': get_wordpress_articles,
+}
+
+
+def run_scenario(scenario, size, path, host, settings_file, batch, queue):
+    """
+    """
+
+    # Each scenario gets a fresh process, so peak memory belongs to it alone
+    # and nothing is left warm from the one before.
+    logging.basicConfig(level=logging.WARNING)
+    config, site = get_config(settings_file, path, host)
+    metrics.configure(config)
+
+    start = time.perf_counter()
+    data.get_index(config)
+    index_load = time.perf_counter() - start
+
+    # Time from asking for an article to having it saved. Fetches overlap,
+    # so for the scrapers this is the gap between finished articles rather
+    # than how long any one of them took from start to finish.
+    articles = iter(SCENARIOS[scenario](site, config, batch))
+    latencies = []
+    start = last = time.perf_counter()
+    for article in articles:
+        data.save_article(article, config)
+        now = time.perf_counter()
+        latencies.append(now - last)
+        last = now
+    seconds = last - start
+
+    queue.put({
+        'scenario': scenario, 'size': size, 'articles': len(latencies),
+        'seconds': round(seconds, 4),
+        'per_sec': round(len(latencies) / seconds, 2) if seconds else None,
+        'p50': get_percentile(latencies, 0.5),
+        'p99': get_percentile(latencies, 0.99),
+        'peak_mb': get_peak_memory(),
+        'index_load': round(index_load, 4),
+        'stages': metrics.get_metrics().snapshot()['stages']
+    })
+
+
+def get_percentile(values, fraction):
+    """
+    """
+
+    if values == []:
+        return None
+    values = sorted(values)
+    return round(values[int(round(fraction * (len(values) - 1)))], 6)
+
+
+def get_peak_memory():
+    """
+    """
+
+    # Peak resident memory in MB. There's no resource module on Windows.
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak /= 1024  # Bytes on macOS, kilobytes everywhere else.
+    return round(peak / 1024, 1)
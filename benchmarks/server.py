@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urljoin, urlsplit
+from urllib.request import urlopen
+
+import regex as re
+from selenium.common import exceptions
+
+from benchmarks import corpus
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    """
+
+    # Keep-alive, like the real sites, so the client's pooling counts.
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        """
+        """
+
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        base_url = 'http://' + self.headers['Host']
+        wp_api = '/wp-json/wp/v2/'
+
+        if url.path == '/search':
+            self.send(corpus.make_serp_html(
+                base_url, query['q'][0], int(query.get('start', ['0'])[0]),
+                self.server.serp_results))
+
+        elif url.path.startswith('/article/'):
+            self.send(corpus.make_article_html(url.path[len('/article/'):]))
+
+        elif url.path == wp_api:
+            self.send(json.dumps({'namespace': 'wp/v2'}),
+                      'application/json')
+
+        elif url.path == wp_api + 'posts':
+            total = self.server.wp_posts
+            per_page = int(query.get('per_page', ['10'])[0])
+            page = int(query.get('page', ['1'])[0])
+            posts = [corpus.make_wp_post(base_url, x) for x in range(
+                (page - 1) * per_page, min(page * per_page, total))]
+            self.send(json.dumps(posts), 'application/json', {
+                'X-WP-Total': total,
+                'X-WP-TotalPages': max(1, -(-total // per_page))})
+
+        elif url.path == wp_api + 'pages':
+            self.send('[]', 'application/json',
+                      {'X-WP-Total': 0, 'X-WP-TotalPages': 1})
+
+        else:
+            self.send('Not Found', status=404)
+
+    def send(self, body, content_type='text/html; charset=utf-8',
+             headers=None, status=200):
+        """
+        """
+
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', len(body))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """
+        """
+
+        pass  # Far too chatty, and it'd slow the server down.
+
+
+class StandInServer:
+    """
+    """
+
+    def __init__(self, serp_results=500, wp_posts=500):
+        """
+        """
+
+        # Port 0 lets the OS pick one that's free.
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        self._server.daemon_threads = True
+        self._server.serp_results = serp_results
+        self._server.wp_posts = wp_posts
+        self.host = '127.0.0.1:{}'.format(self._server.server_port)
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True)
+
+    def start(self):
+        """
+        """
+
+        self._thread.start()
+        return self
+
+    def close(self):
+        """
+        """
+
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class FakeDriver:
+    """
+    """
+
+    # Stands in for a Selenium WebDriver, fetching pages from the stand-in
+    # server instead of driving a real browser. Only does what Browser uses.
+
+    def __init__(self, browser=None):
+        """
+        """
+
+        self.current_url = 'about:blank'
+        self.page_source = '<html><body></body></html>'
+
+    def get(self, url):
+        """
+        """
+
+        with urlopen(url) as response:
+            self.current_url = response.geturl()
+            self.page_source = response.read().decode('utf-8')
+
+    def find_element_by_id(self, tag_id):
+        """
+        """
+
+        match = re.search(
+            r'<a id="{}" href="([^"]*)"'.format(re.escape(tag_id)),
+            self.page_source)
+        if match is None:
+            raise exceptions.NoSuchElementException(tag_id)
+        return FakeElement(
+            self, urljoin(self.current_url, match.group(1).replace(
+                '&amp;', '&')))
+
+    def implicitly_wait(self, seconds):
+        """
+        """
+
+        pass
+
+    def quit(self):
+        """
+        """
+
+        pass
+
+
+class FakeElement:
+    """
+    """
+
+    def __init__(self, driver, href):
+        """
+        """
+
+        self._driver = driver
+        self.href = href
+
+    def click(self):
+        """
+        """
+
+        self._driver.get(self.href)
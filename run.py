@@ -1,8 +1,11 @@
 """
 """
 
+from multiprocessing import freeze_support
+
 from we1schomp import app
 
 
 if __name__ == '__main__':
+    freeze_support()  # Needed for process pools in the Windows build.
     app.run()
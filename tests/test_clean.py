@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import html
+import string
+import unittest
+
+import bleach
+import regex as re
+from unidecode import unidecode
+
+from we1schomp import data
+
+# Strings that have caught out one cleaner or another: markup, entities,
+# control characters, lone surrogates, non-characters and text that isn't
+# in Latin script at all.
+SAMPLES = [
+    '',
+    ' ',
+    'Plain text with nothing to clean.',
+    'Why the Humanities Matter',
+    '<p>Some <b>bold</b> and <i>italic</i> text.</p>',
+    '<script>alert("x")</script>After the script.',
+    '<a href="http://example.com/page">a link</a> http://example.com/x more',
+    'Tom &amp; Jerry &lt;3 &quot;quoted&quot; &#8220;curly&#8221; &nbsp;x',
+    'Bare & ampersand and a < b > c',
+    '&unknown; entity and &#xZZ; broken one',
+    'Tab\there, newline\nthere, return\r, form\x0cfeed, vtab\x0b.',
+    'Control \x00\x01\x07\x1b\x7f characters \x80\x85\x9f here',
+    'Lone surrogate \ud800 and \udfff in text',
+    'Non-characters ﷐ ￾ ￿ \U0001fffe',
+    'Café déjà vu, naïve coöperate, Ångström',
+    '“Smart quotes” — and ‘dashes’ …',
+    'Prices: $5, €10, £20, ¥300',
+    'Привет, мир!',
+    '人文科学的未来',
+    'العلوم الإنسانية',
+    'ἀνθρωπος emoji \U0001f600\U0001f4da',
+    'Spaces   before . and after .dots . .',
+    '<p>Nested <span>tags <em>with &amp; entities</em></span></p>\n<br/>',
+    '<!-- a comment --> <![CDATA[data]]> <?pi?> text',
+    'Zero​width‌joiners‍ and ﻿BOM',
+]
+
+
+def old_clean_string(dirty_string, regex_string=None):
+    """
+    """
+
+    # clean_string as it was before it was sped up, kept here so the new
+    # one can be checked against it.
+    dirty_string = bleach.clean(dirty_string, tags=[], strip=True)
+    dirty_string = html.unescape(dirty_string)
+    ascii_string = unidecode(dirty_string)
+    if not regex_string:
+        regex_string = r'http(.*?)\s|[^a-zA-Z0-9\s\.\,\!\"\'\-\:\;\p{Sc}]'
+    ascii_string = re.sub(re.compile(regex_string), ' ', ascii_string)
+    ascii_string = ''.join([x for x in ascii_string if x in string.printable])
+    ascii_string = ' '.join(ascii_string.split())
+    ascii_string = ascii_string.replace(' .', '.')
+    return ascii_string
+
+
+def old_slugify(title_string):
+    """
+    """
+
+    title_string = old_clean_string(title_string, r'[^a-zA-Z0-9]')
+    return title_string.replace(' ', '-').lower()
+
+
+class CleanStringTest(unittest.TestCase):
+    """
+    """
+
+    def test_clean_string(self):
+        """
+        """
+
+        for sample in SAMPLES:
+            with self.subTest(sample=sample):
+                self.assertEqual(
+                    data.clean_string(sample), old_clean_string(sample))
+
+    def test_clean_string_regex(self):
+        """
+        """
+
+        for sample in SAMPLES:
+            with self.subTest(sample=sample):
+                self.assertEqual(data.clean_string(sample, r'\d'),
+                                 old_clean_string(sample, r'\d'))
+
+    def test_slugify(self):
+        """
+        """
+
+        for sample in SAMPLES:
+            with self.subTest(sample=sample):
+                self.assertEqual(data.slugify(sample), old_slugify(sample))
+
+    def test_clean_strings(self):
+        """
+        """
+
+        expected = [old_clean_string(x) for x in SAMPLES]
+        self.assertEqual(data.clean_strings(SAMPLES), expected)
+        self.assertEqual(data.clean_strings(iter(SAMPLES)), expected)
+
+    def test_clean_strings_processes(self):
+        """
+        """
+
+        expected = [old_clean_string(x) for x in SAMPLES]
+        self.assertEqual(data.clean_strings(SAMPLES, processes=2), expected)
+        self.assertEqual(
+            data.clean_strings(SAMPLES, r'\d', processes=2),
+            [old_clean_string(x, r'\d') for x in SAMPLES])
+
+
+if __name__ == '__main__':
+    unittest.main()
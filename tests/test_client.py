@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import gzip
+import http.server
+import threading
+import unittest
+import zlib
+
+from we1schomp import client
+
+SIZE_MAX = 1024 * 1024
+BOMB_SIZE = 64 * 1024 * 1024  # Compresses down to next to nothing.
+PAGE = b'<html><body>' + b'<p>Why the humanities matter.</p>' * 1000
+
+
+def compress(encoding, body):
+    """
+    """
+
+    if encoding == 'gzip':
+        return gzip.compress(body)
+    if encoding == 'deflate':
+        return zlib.compress(body)
+    if encoding == 'raw-deflate':  # What a lot of servers call "deflate".
+        compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        return compressor.compress(body) + compressor.flush()
+    import brotli
+    return brotli.compress(body, quality=1)
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """
+    """
+
+    protocol_version = 'HTTP/1.1'
+    bodies = {}  # path -> (content-encoding, body)
+
+    def do_GET(self):
+        """
+        """
+
+        encoding, body = self.bodies[self.path]
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        """
+        """
+
+        pass
+
+
+class DecoderTest(unittest.TestCase):
+    """
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        """
+
+        cls.server = http.server.ThreadingHTTPServer(
+            ('127.0.0.1', 0), Handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = 'http://127.0.0.1:{}'.format(cls.server.server_port)
+
+    @classmethod
+    def tearDownClass(cls):
+        """
+        """
+
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        """
+        """
+
+        self.client = client.HttpClient()
+        self.client.SIZE_MAX = SIZE_MAX
+
+    def tearDown(self):
+        """
+        """
+
+        self.client.close()
+
+    def check(self, encoding, header=None):
+        """
+        """
+
+        # A normal page comes back whole, and one that unpacks to far more
+        # than SIZE_MAX is stopped without ever being unpacked in full.
+        header = header or encoding
+        Handler.bodies['/page'] = (header, compress(encoding, PAGE))
+        Handler.bodies['/bomb'] = (
+            header, compress(encoding, b'a' * BOMB_SIZE))
+
+        response = self.client.get(self.base_url + '/page')
+        self.assertEqual(response.body, PAGE)
+
+        with self.assertRaises(client.UnwantedResponse):
+            self.client.get(self.base_url + '/bomb')
+
+        decode = client.get_decoder(header)
+        out = decode(Handler.bodies['/bomb'][1], SIZE_MAX + 1, True)
+        self.assertGreater(len(out), SIZE_MAX)
+        self.assertLess(len(out), SIZE_MAX * 4)
+
+    def test_gzip(self):
+        """
+        """
+
+        self.check('gzip')
+
+    def test_deflate(self):
+        """
+        """
+
+        self.check('deflate')
+
+    def test_raw_deflate(self):
+        """
+        """
+
+        self.check('raw-deflate', 'deflate')
+
+    @unittest.skipUnless('br' in client.get_accept_encoding(),
+                         'needs brotli 1.2 or later')
+    def test_brotli(self):
+        """
+        """
+
+        self.check('br')
+
+    def test_size_max_override(self):
+        """
+        """
+
+        Handler.bodies['/page'] = ('gzip', compress('gzip', PAGE))
+        with self.assertRaises(client.UnwantedResponse):
+            self.client.get(self.base_url + '/page', size_max=len(PAGE) - 1)
+        response = self.client.get(self.base_url + '/page',
+                                   size_max=len(PAGE))
+        self.assertEqual(response.body, PAGE)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from we1schomp import segments
+
+
+def make_article(i):
+    """
+    """
+
+    # Long enough that the middle of each member is compressed data.
+    return {'doc_id': str(i), 'content': 'word{} '.format(i) * 200}
+
+
+class SegmentTest(unittest.TestCase):
+    """
+    """
+
+    def setUp(self):
+        """
+        """
+
+        logging.disable(logging.WARNING)
+        self.path = tempfile.mkdtemp()
+        store = segments.SegmentStore(self.path)
+        self.offsets = [store.write(make_article(i))[1] for i in range(3)]
+        self.filename = os.path.join(
+            self.path, segments.SegmentStore.FILENAME.format(index=0))
+
+    def tearDown(self):
+        """
+        """
+
+        logging.disable(logging.NOTSET)
+        shutil.rmtree(self.path)
+
+    def read_ids(self):
+        """
+        """
+
+        return [(offset, article['doc_id']) for offset, article
+                in segments.read_segment(self.filename)]
+
+    def test_read_segment(self):
+        """
+        """
+
+        self.assertEqual(self.read_ids(), list(zip(self.offsets, '012')))
+        for i, offset in enumerate(self.offsets):
+            self.assertEqual(segments.read_article(self.filename, offset),
+                             make_article(i))
+
+    def test_damaged_tail(self):
+        """
+        """
+
+        # As if the run crashed partway through writing the last article.
+        size = os.path.getsize(self.filename)
+        with open(self.filename, 'r+b') as outfile:
+            outfile.truncate(size - 10)
+        self.assertEqual(self.read_ids(), list(zip(self.offsets[:2], '01')))
+
+        # Opening the store again trims it, so new articles can be read.
+        store = segments.SegmentStore(self.path)
+        self.assertEqual(os.path.getsize(self.filename), self.offsets[2])
+        filename, offset = store.write(make_article(3))
+        self.assertEqual(offset, self.offsets[2])
+        self.assertEqual(self.read_ids(), [
+            (self.offsets[0], '0'), (self.offsets[1], '1'), (offset, '3')])
+        self.assertEqual(segments.repair_segment(self.filename), 0)
+
+    def test_bad_member(self):
+        """
+        """
+
+        # Garbage in the middle of the second article. The third one is
+        # still found, at the same offset.
+        with open(self.filename, 'r+b') as outfile:
+            outfile.seek(self.offsets[1] + 10)
+            outfile.write(b'\xff' * 20)
+        self.assertEqual(self.read_ids(), [
+            (self.offsets[0], '0'), (self.offsets[2], '2')])
+        self.assertEqual(
+            segments.read_article(self.filename, self.offsets[2]),
+            make_article(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,13 +2,20 @@
 """
 """
 
-import time
+import cProfile
+import os
+import pstats
+import sys
+import threading
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from gettext import gettext as _
 
-from we1schomp import data, settings
-from we1schomp.browser import Browser
-from we1schomp.scrape import google, wordpress
+from we1schomp import data, metrics, settings
+from we1schomp.browser import Browser, BrowserPool
+from we1schomp.fetch import FetchEngine
+from we1schomp.state import CrawlState
+from we1schomp.scrape import google, sitemap, wordpress
 
 
 def run():
@@ -27,39 +34,144 @@ def run():
     parser.add_argument('--no-google-search', action='store_true',
                         help=_('Do not use the Google scraper. Articles '
                                'with empty content will still be collected.'))
+    parser.add_argument('--resume', action='store_true',
+                        help=_('Continue from where the last run stopped.'))
+    parser.add_argument('--offline', action='store_true',
+                        help=_('Only use pages already in the cache.'))
+    parser.add_argument('--workers', type=int, default=1,
+                        help=_('Number of sites to scrape at the same time.'))
+    parser.add_argument('--rebuild-index', action='store_true',
+                        help=_('Rebuild the output index from the files in '
+                               'the output folder before starting.'))
+    parser.add_argument('--export', type=str, metavar='PATH',
+                        help=_('Write every saved article to PATH as one '
+                               'JSON file each, then exit.'))
+    parser.add_argument('--build-corpus', action='store_true',
+                        help=_('Rebuild the corpus database from the '
+                               'saved articles, then exit.'))
+    parser.add_argument('--profile', type=str, nargs='?',
+                        const='we1schomp.prof',
+                        help=_('Run under cProfile and save the stats to '
+                               'this file.'))
 
     args = parser.parse_args()
 
+    if args.profile:
+        profile(chomp, args, filename=args.profile)
+    else:
+        chomp(args)
+
+
+def profile(func, *args, filename):
+    """
+    """
+
+    # Fetching, caching and (with --workers) whole sites happen on other
+    # threads. Up to Python 3.11 a profiler only sees the thread it was
+    # started on, so every new thread starts one of its own the first time
+    # it runs any Python, and they're all added up at the end. From 3.12,
+    # cProfile is built on sys.monitoring, which already covers every
+    # thread, and a second profiler can't be started at all.
+    profilers = [cProfile.Profile()]
+    lock = threading.Lock()
+
+    def start_profiler(frame, event, arg):
+        # This only needs to run once per thread, whatever happens.
+        sys.setprofile(None)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return
+        with lock:
+            profilers.append(profiler)
+
+    if sys.version_info < (3, 12):
+        threading.setprofile(start_profiler)
+    try:
+        profilers[0].runcall(func, *args)
+    finally:
+        if sys.version_info < (3, 12):
+            threading.setprofile(None)
+        with lock:
+            stats = pstats.Stats(*profilers)
+        stats.dump_stats(filename)
+        print(_('\nProfile of %s threads saved to %s.')
+              % (len(profilers), filename))
+        stats.sort_stats('cumulative').print_stats(20)
+
+
+def chomp(args):
+    """
+    """
+
     # Start the app
     print(_('\n\nWE1S Chomp --- A Digital Humanities Web Scraper'
             '\n2018 by the WhatEvery1Says Team <we1s.ucsb.edu>.'))
-    time.sleep(2.0)
 
     config, sites = settings.from_ini(args.settings_file)
-    browser = Browser('Chrome', settings=config)
-    time.sleep(3.0)
-
-    # Start scraping!
-    for site in sites:
+    if args.offline:
+        config['CACHE_ENABLE'] = True
+        config['CACHE_OFFLINE'] = True
+    metrics.configure(config)
+    if args.rebuild_index:
+        data.get_index(config).rebuild()
+        if config['DEDUPE_ENABLE']:
+            data.get_duplicate_index(config, rebuild=True)
+        if config['CORPUS_ENABLE']:
+            data.get_corpus(config, rebuild=True)
+    if args.build_corpus:
+        print(_('Building corpus database.'))
+        data.get_corpus(config, rebuild=True).close()
+        return
+    if args.export:
+        print(_('Exporting articles to %s.') % args.export)
+        data.export_articles(config, args.export)
+        return
+    # Nothing here starts Chrome. That waits until a site actually needs
+    # it, so WordPress-only and cached runs never start it at all.
+    fetcher = FetchEngine(settings=config)
+    browser = Browser('Chrome', settings=config, limiter=fetcher.limiter)
+    pool = None
+    if config['BROWSER_POOL_SIZE'] > 0:
+        pool = BrowserPool(settings=config, visible=browser,
+                           limiter=fetcher.limiter)
 
-        print(_('\nScraping %s.' % site['name']))
+    # Keep track of how far we've got, so a crashed or cancelled run can be
+    # picked up again with --resume.
+    state = CrawlState(os.path.join(
+        config['OUTPUT_PATH'], config['STATE_FILENAME']))
+    if args.resume:
+        print(_('Resuming from last run.'))
+    else:
+        state.reset()
 
-        # Do WordPress scrapes.
-        if (config['WORDPRESS_ENABLE'] and site['wordpress_enable']
-              and not args.no_wordpress
-              and wordpress.check_for_api(site, config)):
-            for article in wordpress.get_articles(site, config):
-                data.save_article(article, config)
-        
-        # Do Google scrapes.
+    # Start scraping! Sites can run side by side; they share one fetcher, so
+    # its per-host scheduling keeps each domain polite while the waits on
+    # different domains overlap.
+    try:
+        if args.workers > 1:
+            with ThreadPoolExecutor(max_workers=args.workers) as workers:
+                futures = [
+                    workers.submit(scrape_site, site, config, args, browser,
+                                   fetcher, state, pool)
+                    for site in sites]
+                for future in as_completed(futures):
+                    future.result()
         else:
-            if (config['GOOGLE_ENABLE'] and site['google_enable']
-                  and not args.no_google_search):
-                for article in google.get_urls(site, config, browser):
-                    data.save_article(article, config)
-            for article in google.get_content(site, config, browser):
-                data.save_article(article, config)
+            for site in sites:
+                scrape_site(
+                    site, config, args, browser, fetcher, state, pool)
+
+    # Whatever happened, show where the time went.
+    finally:
+        print('\n' + metrics.get_metrics().summary())
+        metrics.get_metrics().close()
 
+    state.close()
+    fetcher.close()
+    if pool is not None:
+        pool.close()
     browser.close()
     print(_('\nQueue completed. Goodbye!\n'))
 
@@ -67,3 +179,44 @@ def run():
     # a bat file.
     if config['PAUSE_ON_EXIT']:
         input('Press "Enter" to exit...')
+
+
+def scrape_site(site, config, args, browser, fetcher, state, pool):
+    """
+    """
+
+    print(_('\nScraping %s.' % site['name']))
+
+    # Do WordPress scrapes.
+    if (config['WORDPRESS_ENABLE'] and site['wordpress_enable']
+          and not args.no_wordpress
+          and wordpress.check_for_api(site, config, fetcher)):
+        for article in wordpress.get_articles(site, config, fetcher):
+            data.save_article(article, config)
+
+    # Do Google scrapes, or read the sitemaps instead if that's what the
+    # site asks for. The Google switches only turn off Google.
+    else:
+        search = (config['GOOGLE_ENABLE'] and site['google_enable']
+                  and not args.no_google_search)
+        if config['CACHE_OFFLINE'] and (
+                search or site['discovery'] == 'sitemap'):
+            # Search pages come from the live browser and sitemaps are read
+            # straight off the network, neither from the cache, so offline
+            # runs go straight to the articles we already have.
+            print(_('Offline, skipping URL discovery.'))
+        elif site['discovery'] == 'sitemap':
+            # Sitemaps and feeds are plain fetches, so there's no need to
+            # wait for the browser.
+            for article in sitemap.get_urls(site, config, fetcher):
+                data.save_article(article, config)
+        elif search:
+            # Google searches click through result pages one after
+            # another, so a site holds on to the browser until it's done.
+            with browser.lock:
+                for article in google.get_urls(
+                        site, config, browser, state):
+                    data.save_article(article, config)
+        for article in google.get_content(
+                site, config, browser, fetcher, state, pool):
+            data.save_article(article, config)
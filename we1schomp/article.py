@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+from uuid import uuid4
+
+# The keys every article has in its JSON file, in the order they're
+# written. Anything else that turns up in a file is kept and written back
+# after these.
+FIELDS = ('doc_id', 'attachment_id', 'namespace', 'name', 'metapath', 'pub',
+          'pub_date', 'pub_short', 'title', 'url', 'content', 'length',
+          'search_term')
+OPTIONAL_FIELDS = ('search_terms', 'duplicate_of')
+
+
+class Article:
+    """
+    """
+
+    # Scrapes can hold a lot of these at once, so no per-article __dict__.
+    __slots__ = ('doc_id', 'attachment_id', 'namespace', '_name', '_metapath',
+                 'pub', 'pub_date', 'pub_short', 'title', 'url', '_content',
+                 '_length', 'search_term', 'search_terms', 'duplicate_of',
+                 'slug', '_config', 'extra')
+
+    def __init__(self, url='', title='', pub='', pub_short='',
+                 pub_date='N.D.', search_term='', content='', doc_id=None,
+                 attachment_id='', namespace=None, name=None, metapath=None,
+                 length=None, search_terms=None, duplicate_of=None,
+                 slug=None, config=None, extra=None):
+        """
+        """
+
+        self.doc_id = doc_id or str(uuid4())
+        self.attachment_id = attachment_id
+        if namespace is None and config is not None:
+            namespace = config['NAMESPACE']
+        self.namespace = namespace or ''
+        self.pub = pub
+        self.pub_date = pub_date
+        self.pub_short = pub_short
+        self.title = title
+        self.url = url
+        self._content = content
+        self.search_term = search_term
+        self.search_terms = search_terms
+        self.duplicate_of = duplicate_of
+        self.extra = extra
+
+        # Name, metapath and length can all be worked out from the rest, so
+        # don't bother until someone asks. Usually that's when it's saved.
+        self._name = name
+        self._metapath = metapath
+        self._length = length
+        self.slug = slug  # For the name. Defaults to the slugified title.
+        self._config = config
+
+    @property
+    def name(self):
+        """
+        """
+
+        if self._name is None and self._config is not None:
+            from we1schomp.data import slugify  # data imports us.
+            slug = self.slug
+            if slug is None:
+                slug = slugify(self.title)
+            self._name = self._config['DB_NAME'].format(
+                site=self.pub_short, term=slugify(self.search_term),
+                slug=slug)
+        return self._name or ''
+
+    @property
+    def metapath(self):
+        """
+        """
+
+        if self._metapath is None and self._config is not None:
+            self._metapath = self._config['METAPATH'].format(
+                site=self.pub_short)
+        return self._metapath or ''
+
+    @property
+    def content(self):
+        """
+        """
+
+        return self._content
+
+    @content.setter
+    def content(self, value):
+        """
+        """
+
+        self._content = value
+        self._length = None  # Count it again next time.
+
+    @property
+    def length(self):
+        """
+        """
+
+        if self._length is None:
+            if self._content == '':
+                self._length = ''
+            else:
+                self._length = f"{len(self._content.split(' '))} words"
+        return self._length
+
+    @property
+    def pending(self):
+        """
+        """
+
+        # Still needs its content scraped. Duplicates that had their content
+        # dropped are done with, even though they're empty.
+        return self._content == '' and self.duplicate_of is None
+
+    @classmethod
+    def from_dict(cls, json_data):
+        """
+        """
+
+        json_data = dict(json_data)
+        article = cls(**{x: json_data.pop(x) for x in FIELDS + OPTIONAL_FIELDS
+                         if x in json_data})
+        article.extra = json_data or None
+        return article
+
+    def to_dict(self):
+        """
+        """
+
+        json_data = {x: getattr(self, x) for x in FIELDS}
+        for field in OPTIONAL_FIELDS:
+            value = getattr(self, field)
+            if value is not None:
+                json_data[field] = value
+        if self.extra:
+            json_data.update(self.extra)
+        return json_data
+
+    def __repr__(self):
+        """
+        """
+
+        return '<Article {} {}>'.format(self.doc_id, self.url)
@@ -4,12 +4,15 @@
 
 import logging
 import os
+import queue
 import random
+import threading
+from contextlib import contextmanager
 from gettext import gettext as _
 from time import sleep
+from urllib.error import URLError
 
-from selenium import webdriver
-from selenium.common import exceptions
+from we1schomp.client import Response
 
 
 class Browser:
@@ -17,43 +20,66 @@ class Browser:
     """
 
     BROWSER_TYPE = 'Chrome'
+    HEADLESS = False
     WAIT_FOR_KEYPRESS = False
     SANITY_SLEEP = 1.0  # Seconds to wait between each browser action.
     SLEEP_MIN = 1.0
     SLEEP_MAX = 1.0
 
-    def __init__(self, browser_type='Chrome', settings=None):
+    def __init__(self, browser_type='Chrome', settings=None, headless=False,
+                 driver_factory=None, limiter=None):
         """
         """
 
         self._log = logging.getLogger(__name__)
 
+        # There's only one window, so anyone running in another thread has
+        # to take turns with it.
+        self.lock = threading.RLock()
+
         self.BROWSER_TYPE = browser_type
+        self.HEADLESS = headless
         if settings is not None:
             self.WAIT_FOR_KEYPRESS = settings['WAIT_FOR_KEYPRESS']
             self.SLEEP_MIN = settings['SLEEP_MIN']
             self.SLEEP_MAX = settings['SLEEP_MAX']
             self.SANITY_SLEEP = settings['SANITY_SLEEP']
-        
-        self._driver = self.get_driver()
+
+        # Tests (or other browsers) can supply their own driver. It gets
+        # this Browser, so it can check HEADLESS and so on.
+        self._driver_factory = driver_factory
+        self.limiter = limiter  # Shared with everything else, if we have one.
+        self.pages = 0  # How many pages this driver has loaded.
+
+        self._driver = None  # Started the first time it's needed.
 
         # We need to guarantee the driver closes when we're done with it.
         # There's probably a better way to do this!
         # atexit.register(self.close)
         
+    @property
+    def driver(self):
+        """
+        """
+
+        with self.lock:
+            if self._driver is None:
+                self._driver = self.get_driver()
+            return self._driver
+
     @property
     def current_url(self):
         """
         """
 
-        return self._driver.current_url
+        return self.driver.current_url
 
     @property
     def source(self):
         """
         """
 
-        return self._driver.page_source
+        return self.driver.page_source
 
     def get_driver(self):
         """
@@ -61,11 +87,21 @@ class Browser:
 
         self._log.info(_('Starting %s.'), self.BROWSER_TYPE)
 
+        if self._driver_factory is not None:
+            return self._driver_factory(self)
+
         if self.BROWSER_TYPE == 'Chrome':
 
+            # Selenium is slow to import and plenty of runs never start a
+            # browser, so it waits until one does.
+            from selenium import webdriver
+
             opts = webdriver.ChromeOptions()
             opts.add_argument('--log-level=3')  # Suppress warnings.
             opts.add_argument('--incognito')
+            if self.HEADLESS:
+                opts.add_argument('--headless')
+                opts.add_argument('--disable-gpu')
 
             driver_path = os.path.join(os.getcwd(), 'chromedriver.exe')
             self._log.debug(_('Using WebDriver at %s.'), driver_path)
@@ -92,25 +128,45 @@ class Browser:
             input(_('Press "Enter" to continue...'))
 
         self._log.info(_('%s going to: %s'), self.BROWSER_TYPE, url)
-        return self._driver.get(url)
+        self.pages += 1
+        return self.driver.get(url)
 
-    def sleep(self, sleep_time=None):
+    def sleep(self, sleep_time=None, url=None):
         """
         """
 
+        # Let the rate limiter decide how long to wait for this host, but
+        # never go faster than the browser settings allow. Nothing tells us
+        # when a page loads quickly, so this mostly just backs off after
+        # CAPTCHAs.
+        if not sleep_time and self.limiter is not None:
+            self.limiter.wait(
+                url or self.driver.current_url,
+                minimum=random.uniform(self.SLEEP_MIN, self.SLEEP_MAX))
+            return
+
         if not sleep_time:
             sleep_time = random.uniform(self.SLEEP_MIN, self.SLEEP_MAX)
 
         self._log.debug(_('Sleeping for %.2f seconds.'), sleep_time)
         sleep(sleep_time)
 
+    @property
+    def needs_human(self):
+        """
+        """
+
+        return '/sorry/' in self.driver.current_url
+
     def captcha_check(self):
         """
         """
 
-        if '/sorry/' in self._driver.current_url:
+        if self.needs_human:
             self._log.error(_('CAPTCHA detected! Waiting for human...'))
-            while '/sorry/' in self._driver.current_url:
+            if self.limiter is not None:
+                self.limiter.report(self.driver.current_url, 429)
+            while '/sorry/' in self.driver.current_url:
                 sleep(self.SANITY_SLEEP)
             self._log.info(_('Ok!'))
             self.sleep()
@@ -119,8 +175,10 @@ class Browser:
         """
         """
 
+        from selenium.common import exceptions
+
         try:
-            item = self._driver.find_element_by_id(tag_id)
+            item = self.driver.find_element_by_id(tag_id)
         except exceptions.NoSuchElementException:
             return False
 
@@ -132,5 +190,146 @@ class Browser:
         """
         """
 
+        if self._driver is None:
+            return
         self._log.info(_('Closing %s.'), self.BROWSER_TYPE)
         self._driver.quit()
+        self._driver = None
+
+
+class BrowserPool:
+    """
+    """
+
+    SIZE = 2
+    PAGES_MAX = 50  # Start a fresh browser after this many pages.
+
+    def __init__(self, settings=None, visible=None, driver_factory=None,
+                 limiter=None):
+        """
+        """
+
+        self._log = logging.getLogger(__name__)
+
+        if settings is not None:
+            self.SIZE = settings['BROWSER_POOL_SIZE']
+            self.PAGES_MAX = settings['BROWSER_POOL_PAGES_MAX']
+
+        self._settings = settings
+        self._driver_factory = driver_factory
+        self.limiter = limiter  # Handed on to every browser we start.
+
+        # CAPTCHAs need a person to solve them, and they can't do that in a
+        # headless browser, so those get sent to the visible one.
+        self.visible = visible
+
+        self._lock = threading.Lock()
+        self._idle = queue.Queue()
+        self._count = 0  # Browsers open, idle or not.
+
+    @contextmanager
+    def lease(self):
+        """
+        """
+
+        from selenium.common import exceptions
+
+        browser = self._acquire()
+        crashed = False
+        try:
+            yield browser
+        except exceptions.WebDriverException:
+            crashed = True
+            raise
+        finally:
+            self._release(browser, crashed)
+
+    def fetch(self, url):
+        """
+        """
+
+        from selenium.common import exceptions
+
+        try:
+            with self.lease() as browser:
+                browser.go(url)
+                if not browser.needs_human:
+                    return Response(browser.current_url, 200, {},
+                                    browser.source)
+
+            if self.visible is None:
+                raise URLError(_('CAPTCHA with no visible browser: %s') % url)
+            with self.visible.lock:
+                self.visible.go(url)
+                self.visible.captcha_check()
+                return Response(self.visible.current_url, 200, {},
+                                self.visible.source)
+        except exceptions.WebDriverException as e:
+            raise URLError(e)
+
+    def close(self):
+        """
+        """
+
+        while True:
+            try:
+                browser = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._quit(browser)
+
+    def _acquire(self):
+        """
+        """
+
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+
+            # Start up another browser if we're under the limit. Otherwise
+            # wait for someone to give one back. Keep checking, since a
+            # browser that gets recycled frees up room without coming back.
+            with self._lock:
+                start_new = self._count < self.SIZE
+                if start_new:
+                    self._count += 1
+            if start_new:
+                try:
+                    return Browser(settings=self._settings, headless=True,
+                                   driver_factory=self._driver_factory,
+                                   limiter=self.limiter)
+                except Exception:
+                    with self._lock:
+                        self._count -= 1
+                    raise
+
+            try:
+                return self._idle.get(timeout=1.0)
+            except queue.Empty:
+                continue
+
+    def _release(self, browser, crashed):
+        """
+        """
+
+        if crashed or browser.pages >= self.PAGES_MAX:
+            self._log.debug(
+                _('Recycling browser (%s pages).'), browser.pages)
+            self._quit(browser)
+            return
+        self._idle.put(browser)
+
+    def _quit(self, browser):
+        """
+        """
+
+        from selenium.common import exceptions
+
+        with self._lock:
+            self._count -= 1
+        try:
+            browser.close()
+        except exceptions.WebDriverException as e:
+            self._log.debug(_('Error closing browser: %s'), e)
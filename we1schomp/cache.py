@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from gettext import gettext as _
+from logging import getLogger
+from urllib.error import URLError
+
+from we1schomp.client import (
+    HttpClient, Response, UnwantedResponse, get_mime_type)
+
+
+class CacheMiss(URLError):
+    """
+    """
+
+
+class ResponseCache:
+    """
+    """
+
+    PATH = 'cache'
+    SIZE_MAX = 1024 * 1024 * 1024  # Bytes.
+    OFFLINE = False  # Only serve from the cache, never from the network.
+
+    def __init__(self, settings=None, client=None):
+        """
+        """
+
+        self._log = getLogger(__name__)
+        self._lock = threading.Lock()
+
+        if client is None:
+            client = HttpClient(settings=settings)
+        self.client = client
+
+        if settings is not None:
+            self.PATH = settings['CACHE_PATH']
+            self.SIZE_MAX = settings['CACHE_SIZE_MAX']
+            self.OFFLINE = settings['CACHE_OFFLINE']
+
+        if not os.path.exists(self.PATH):
+            self._log.info(_('Creating directory: %s'), self.PATH)
+            os.makedirs(self.PATH)
+
+        # Keep track of what's in the cache and when it was last used, so
+        # we know what to throw out when it gets too big. File modification
+        # times double as "last used" times between runs.
+        self._entries = {}  # key -> [size, last used]
+        self._size = 0
+        for folder, subfolders, files in os.walk(self.PATH):
+            for filename in files:
+                if not filename.endswith('.body'):
+                    continue
+                stat = os.stat(os.path.join(folder, filename))
+                key = filename[:-len('.body')]
+                self._entries[key] = [stat.st_size, stat.st_mtime]
+                self._size += stat.st_size
+
+        self._log.debug(
+            _('Cache has %s pages (%.1f MB).'),
+            len(self._entries), self._size / 1024 / 1024)
+
+    def fetch(self, url, accept=None):
+        """
+        """
+
+        key = get_key(url)
+        entry = self._load(key, url)
+
+        if self.OFFLINE:
+            if entry is None:
+                raise CacheMiss(_('Not in cache: %s') % url)
+            self._log.debug(_('Cache hit: %s'), url)
+
+            # Pages cached before we started checking may not be what the
+            # caller wants.
+            content_type = entry.headers.get('content-type')
+            if (accept is not None and content_type is not None
+                    and get_mime_type(content_type) not in accept):
+                raise UnwantedResponse(
+                    _('Not %s (%s): %s') % (
+                        '/'.join(accept), content_type, url), 200)
+            return entry
+
+        # Ask the server whether our copy is still good.
+        headers = {}
+        if entry is not None:
+            if 'etag' in entry.headers:
+                headers['If-None-Match'] = entry.headers['etag']
+            if 'last-modified' in entry.headers:
+                headers['If-Modified-Since'] = entry.headers['last-modified']
+
+        response = self.client.get(url, headers, accept)
+        if response.status == 304 and entry is not None:
+            self._log.debug(_('Cache hit (not modified): %s'), url)
+            return entry
+
+        self._store(key, url, response.body, response.headers)
+        return response
+
+    def _load(self, key, url):
+        """
+        """
+
+        body_file, meta_file = self._paths(key)
+        try:
+            with open(meta_file, 'r', encoding='utf-8') as infile:
+                meta = json.load(infile)
+            with open(body_file, 'rb') as infile:
+                body = infile.read()
+        except (OSError, ValueError):
+            return None
+
+        self._touch(key, body_file)
+        return Response(url, 200, meta['headers'], body)
+
+    def _store(self, key, url, body, headers):
+        """
+        """
+
+        body_file, meta_file = self._paths(key)
+        os.makedirs(os.path.dirname(body_file), exist_ok=True)
+
+        # Write the headers last: a page without them isn't loaded, so a
+        # crash halfway through just looks like a miss.
+        _write_file(body_file, body)
+        _write_file(meta_file, json.dumps(
+            {'url': url, 'headers': headers}).encode('utf-8'))
+
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries[key][0]
+            self._entries[key] = [len(body), time.time()]
+            self._size += len(body)
+            if self._size > self.SIZE_MAX:
+                self._evict()
+
+    def _touch(self, key, body_file):
+        """
+        """
+
+        now = time.time()
+        with self._lock:
+            if key in self._entries:
+                self._entries[key][1] = now
+        try:
+            os.utime(body_file, (now, now))
+        except OSError:
+            pass
+
+    def _evict(self):
+        """
+        """
+
+        # Throw out the least recently used pages until we're comfortably
+        # under the limit, so we don't end up doing this on every save.
+        target = self.SIZE_MAX * 0.9
+        for key in sorted(self._entries, key=lambda k: self._entries[k][1]):
+            if self._size <= target:
+                break
+            size, last_used = self._entries.pop(key)
+            self._size -= size
+            for filename in self._paths(key):
+                try:
+                    os.remove(filename)
+                except OSError:
+                    pass
+            self._log.debug(_('Cache evicted: %s'), key)
+
+    def _paths(self, key):
+        """
+        """
+
+        # Spread files over subfolders so no one folder gets too big.
+        folder = os.path.join(self.PATH, key[:2])
+        return (os.path.join(folder, key + '.body'),
+                os.path.join(folder, key + '.json'))
+
+
+def get_key(url):
+    """
+    """
+
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+def _write_file(filename, content):
+    """
+    """
+
+    temp_filename = '{}.{}.tmp'.format(filename, threading.get_ident())
+    with open(temp_filename, 'wb') as outfile:
+        outfile.write(content)
+    os.replace(temp_filename, filename)
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from email.utils import parsedate_tz
+from gettext import gettext as _
+from logging import getLogger
+
+import regex as re
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS articles (
+    id INTEGER PRIMARY KEY,
+    doc_id TEXT NOT NULL UNIQUE,
+    name TEXT,
+    pub TEXT,
+    pub_short TEXT,
+    pub_date TEXT,
+    date TEXT,
+    title TEXT,
+    url TEXT,
+    search_term TEXT,
+    length INTEGER,
+    duplicate_of TEXT,
+    content TEXT,
+    json TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS terms (
+    doc_id TEXT NOT NULL,
+    term TEXT NOT NULL,
+    PRIMARY KEY (term, doc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS articles_site ON articles (pub_short, date);
+CREATE INDEX IF NOT EXISTS articles_date ON articles (date);
+CREATE INDEX IF NOT EXISTS terms_doc ON terms (doc_id);
+'''
+
+# The full-text index reads its text out of the articles table rather than
+# keeping a second copy, and these triggers keep the two in step.
+FTS_SCHEMA = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5 (
+    title, content, content='articles', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS articles_ai AFTER INSERT ON articles BEGIN
+    INSERT INTO articles_fts (rowid, title, content)
+        VALUES (new.id, new.title, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS articles_ad AFTER DELETE ON articles BEGIN
+    INSERT INTO articles_fts (articles_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+END;
+CREATE TRIGGER IF NOT EXISTS articles_au AFTER UPDATE ON articles BEGIN
+    INSERT INTO articles_fts (articles_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+    INSERT INTO articles_fts (rowid, title, content)
+        VALUES (new.id, new.title, new.content);
+END;
+'''
+
+UPSERT = '''
+INSERT INTO articles (doc_id, name, pub, pub_short, pub_date, date, title,
+                      url, search_term, length, duplicate_of, content, json)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (doc_id) DO UPDATE SET
+        name = excluded.name, pub = excluded.pub,
+        pub_short = excluded.pub_short, pub_date = excluded.pub_date,
+        date = excluded.date, title = excluded.title, url = excluded.url,
+        search_term = excluded.search_term, length = excluded.length,
+        duplicate_of = excluded.duplicate_of, content = excluded.content,
+        json = excluded.json
+'''
+
+# Dates turn up however the site or Google felt like writing them.
+DATE_FORMATS = ('%Y-%m-%d', '%b %d, %Y', '%B %d, %Y', '%d %b %Y',
+                '%d %B %Y', '%m/%d/%Y')
+_ISO_DATE = re.compile(r'^(\d{4})-(\d{2})-(\d{2})')
+
+
+class CorpusIndex:
+    """
+    """
+
+    def __init__(self, filename):
+        """
+        """
+
+        self._log = getLogger(__name__)
+        self._lock = threading.Lock()
+
+        # Like the crawl state, every save is committed straight away, so
+        # the database always matches the output folder.
+        self.filename = filename
+        self._db = sqlite3.connect(
+            filename, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(SCHEMA)
+
+        # Not every SQLite is built with FTS5. Everything but text search
+        # still works without it.
+        self.fts = True
+        try:
+            self._db.executescript(FTS_SCHEMA)
+        except sqlite3.OperationalError as e:
+            self._log.warning(_('No full-text search in %s: %s'),
+                              self.filename, e)
+            self.fts = False
+
+    def update(self, article):
+        """
+        """
+
+        row = _article_row(article)
+        terms = article.search_terms or [article.search_term]
+        with self._lock:
+            self._db.execute('BEGIN')
+            try:
+                self._update(row, terms)
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+
+    def rebuild(self, articles):
+        """
+        """
+
+        self._log.info(_('Building corpus database: %s'), self.filename)
+        count = 0
+        with self._lock:
+            self._db.execute('BEGIN')
+            try:
+                self._db.execute('DELETE FROM articles')
+                self._db.execute('DELETE FROM terms')
+                if self.fts:
+                    self._db.execute(
+                        "INSERT INTO articles_fts (articles_fts) "
+                        "VALUES ('delete-all')")
+                for article in articles:
+                    self._update(
+                        _article_row(article),
+                        article.search_terms or [article.search_term])
+                    count += 1
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            if self.fts:
+                self._db.execute(
+                    "INSERT INTO articles_fts (articles_fts) "
+                    "VALUES ('optimize')")
+        return count
+
+    def query(self, site=None, term=None, text=None, start=None, end=None,
+              limit=None):
+        """
+        """
+
+        # Returns the articles' JSON, newest first, for whichever of these
+        # were given. Dates are "YYYY-MM-DD" and both ends are included.
+        sql = 'SELECT a.json FROM articles a'
+        where, params = [], []
+        if text is not None:
+            if not self.fts:
+                raise RuntimeError(_('No full-text search in %s.')
+                                   % self.filename)
+            sql += ' JOIN articles_fts f ON f.rowid = a.id'
+            where.append('articles_fts MATCH ?')
+            params.append(text)
+        if term is not None:
+            sql += ' JOIN terms t ON t.doc_id = a.doc_id'
+            where.append('t.term = ?')
+            params.append(term)
+        if site is not None:
+            where.append('a.pub_short = ?')
+            params.append(site)
+        if start is not None:
+            where.append('a.date >= ?')
+            params.append(start)
+        if end is not None:
+            where.append('a.date <= ?')
+            params.append(end)
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY a.date DESC, a.id'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [json.loads(x[0]) for x in rows]
+
+    def close(self):
+        """
+        """
+
+        with self._lock:
+            self._db.close()
+
+    def _update(self, row, terms):
+        """
+        """
+
+        self._db.execute(UPSERT, row)
+        self._db.execute('DELETE FROM terms WHERE doc_id = ?', (row[0],))
+        self._db.executemany(
+            'INSERT OR IGNORE INTO terms VALUES (?, ?)',
+            [(row[0], x) for x in terms if x])
+
+
+def _article_row(article):
+    """
+    """
+
+    json_data = article.to_dict()
+    length = article.length.split(' ', 1)[0]
+    return (
+        article.doc_id, article.name, article.pub, article.pub_short,
+        article.pub_date, parse_date(article.pub_date), article.title,
+        article.url, article.search_term,
+        int(length) if length.isdigit() else None, article.duplicate_of,
+        article.content, json.dumps(json_data, ensure_ascii=False))
+
+
+def parse_date(date_string):
+    """
+    """
+
+    # Best effort at "YYYY-MM-DD", so dates sort and compare. Anything we
+    # can't read (including "N.D.") is left out rather than guessed.
+    date_string = (date_string or '').strip()
+    match = _ISO_DATE.match(date_string)
+    if match is not None:
+        return '-'.join(match.groups())
+
+    parsed = parsedate_tz(date_string)  # RSS and e-mail style.
+    if parsed is not None and parsed[0] > 0:
+        return '{:04d}-{:02d}-{:02d}'.format(*parsed[:3])
+
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(
+                date_string, date_format).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return None
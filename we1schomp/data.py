@@ -6,14 +6,20 @@ import html
 import json
 import os
 import string
-import sys
+import threading
 import time
+import zlib
+from functools import partial
 from gettext import gettext as _
 from logging import getLogger
 
-import bleach
 import regex as re
-from unidecode import unidecode
+
+from we1schomp import metrics, segments
+from we1schomp.article import Article
+from we1schomp.corpus import CorpusIndex
+from we1schomp.dedupe import DuplicateIndex, simhash
+from we1schomp.urls import canonical_url
 
 
 def load_articles(path, no_skip=False):
@@ -21,8 +27,8 @@ def load_articles(path, no_skip=False):
     """
 
     log = getLogger(__name__)
-    articles = []
     count = 0
+    skipped = 0
 
     log.debug(_('Searching for JSON files in %s.'), path)
     for json_data, json_file in load_json_files_from_path(path):
@@ -31,23 +37,49 @@ def load_articles(path, no_skip=False):
         # we've already scraped it, so we can safely skip it here.
         if json_data['content'] != '' and not no_skip:
             log.info(_('Skipping: %s'), json_file)
+            skipped += 1
             continue
 
         # Keep track of how many files we've loaded so we can report how many
         # we've skipped.
         log.info(_('Loading: %s'), json_file)
         count += 1
-        articles.append(json_data)
+        yield Article.from_dict(json_data)
+
+    log.info(_('Found %s files, %s skipped.'), count, skipped)
 
-    log.info(_('Found %s files, %s skipped.'), count, len(articles) - count)
-    return articles
+
+def load_pending_articles(site, config):
+    """
+    """
+
+    log = getLogger(__name__)
+    index = get_index(config)
+
+    # The index already knows which files still have empty content, so we
+    # only ever open the ones we need, one at a time.
+    pending = index.pending(site)
+    log.info(_('Found %s files for %s.'), len(pending), site)
+    for doc_id, filename in pending:
+        article = _read_article(config, index.locate(doc_id))
+        if article is None:
+            log.warning(_('Missing (try --rebuild-index): %s'), filename)
+            continue
+
+        if article.content != '':
+            log.info(_('Skipping: %s'), filename)
+            continue
+
+        log.info(_('Loading: %s'), filename)
+        yield article
 
 
 def load_json_files_from_path(path):
     """
     """
 
-    for json_file in [f for f in os.listdir(path) if f.endswith('.json')]:
+    json_files = sorted(f for f in os.listdir(path) if f.endswith('.json'))
+    for json_file in json_files:
 
         filename = os.path.join(path, json_file)
         with open(filename, 'r', encoding='utf-8') as infile:
@@ -56,23 +88,446 @@ def load_json_files_from_path(path):
         yield json_data, json_file
 
 
+class OutputIndex:
+    """
+    """
+
+    # The index only ever grows by appending, so every so often it's written
+    # out again from memory with just the newest line for each article. That
+    # happens once it's this many times longer than it needs to be.
+    COMPACT_RATIO = 2
+    COMPACT_MIN = 1000  # Lines. Don't bother for small indexes.
+
+    def __init__(self, path, filename_format, index_filename,
+                 segment_format=None):
+        """
+        """
+
+        self._log = getLogger(__name__)
+        self._lock = threading.Lock()
+
+        self.path = path
+        self.index_file = os.path.join(path, index_filename)
+        self._pattern = segments.get_filename_pattern(filename_format)
+        self.segment_format = segment_format
+
+        # Articles saved to segments also have the offset they start at.
+        self._locations = {}  # doc_id -> (filename, offset or None)
+        self._urls = {}  # canonical URL -> doc_id
+        self._pending = {}  # pub_short -> {doc_id: filename} with no content
+        self._next_index = {}  # filename template -> next free index
+        self._records = {}  # doc_id -> newest index line
+        self._lines = 0  # Lines in the index file.
+
+        if not os.path.exists(self.index_file) or not self.load():
+            self.rebuild()
+
+    def load(self):
+        """
+        """
+
+        self._log.debug(_('Loading index: %s'), self.index_file)
+        with open(self.index_file, 'r', encoding='utf-8') as infile:
+            for line in infile:
+                self._lines += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Probably a half-written line from a crash. Everything
+                    # before it is still good.
+                    self._log.warning(_('Bad index entry: %s'), line.strip())
+                    continue
+
+                # Indexes from older versions don't know which files still
+                # need content, so they'll have to be rebuilt.
+                if 'pending' not in record:
+                    self._log.info(_('Index is out of date.'))
+                    return False
+                self._add(record)
+
+        return True
+
+    def rebuild(self):
+        """
+        """
+
+        self._log.info(_('Building index for %s.'), self.path)
+        self._locations = {}
+        self._urls = {}
+        self._pending = {}
+        self._next_index = {}
+        self._records = {}
+
+        # Write to a temporary file and swap it in, so a crash here can't
+        # leave us with half an index. Segments go last, in the order they
+        # were written, so the newest copy of each article wins.
+        temp_file = self.index_file + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as outfile:
+            for json_data, json_file in load_json_files_from_path(self.path):
+                record = _index_record(
+                    Article.from_dict(json_data), json_file)
+                self._add(record)
+                outfile.write(json.dumps(record) + '\n')
+
+            if self.segment_format:
+                for i, segment in segments.list_segments(
+                        self.path, self.segment_format):
+                    for offset, json_data in segments.read_segment(
+                            os.path.join(self.path, segment)):
+                        record = _index_record(
+                            Article.from_dict(json_data), segment, offset)
+                        self._add(record)
+                        outfile.write(json.dumps(record) + '\n')
+        os.replace(temp_file, self.index_file)
+        self._lines = len(self._records)
+
+    def locate(self, doc_id):
+        """
+        """
+
+        return self._locations.get(doc_id)
+
+    def locations(self):
+        """
+        """
+
+        # In file order, so reading them all back is one pass over each
+        # segment.
+        with self._lock:
+            return sorted(self._locations.items(),
+                          key=lambda x: (x[1][0], x[1][1] or 0))
+
+    def find_url(self, url):
+        """
+        """
+
+        return self._urls.get(canonical_url(url))
+
+    def pending(self, site):
+        """
+        """
+
+        # Take a copy, since saving these articles changes the list.
+        with self._lock:
+            return list(self._pending.get(site, {}).items())
+
+    def reserve(self, doc_id, template):
+        """
+        """
+
+        with self._lock:
+            location = self._locations.get(doc_id)
+            if location is not None and location[1] is None:
+                return location[0]
+
+            # The counter should always be right, but someone might have
+            # dropped files into the output folder by hand, so make sure.
+            index = self._next_index.get(template, 0)
+            filename = template.format(index=index)
+            while os.path.exists(os.path.join(self.path, filename)):
+                index += 1
+                filename = template.format(index=index)
+
+            self._add({'doc_id': doc_id, 'filename': filename})
+            return filename
+
+    def update(self, article, filename, offset=None):
+        """
+        """
+
+        record = _index_record(article, filename, offset)
+        with self._lock:
+
+            # Appending a single line is as close to atomic as we can get
+            # without rewriting the whole file on every save. If the same
+            # article comes up again later, the last line wins.
+            with open(self.index_file, 'a', encoding='utf-8') as outfile:
+                outfile.write(json.dumps(record) + '\n')
+            self._lines += 1
+            self._add(record)
+
+            if (self._lines > self.COMPACT_MIN and self._lines
+                    > self.COMPACT_RATIO * len(self._records)):
+                self._compact()
+
+    def _compact(self):
+        """
+        """
+
+        self._log.debug(_('Compacting index: %s'), self.index_file)
+        temp_file = self.index_file + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as outfile:
+            for record in self._records.values():
+                outfile.write(json.dumps(record) + '\n')
+        os.replace(temp_file, self.index_file)
+        self._lines = len(self._records)
+
+    def _add(self, record):
+        """
+        """
+
+        doc_id, filename = record['doc_id'], record['filename']
+        self._locations[doc_id] = (filename, record.get('offset'))
+        if 'pending' in record:  # Not just a reserved filename.
+            self._records[doc_id] = record
+
+        url = record.get('url')
+        if url and url not in self._urls:
+            self._urls[url] = doc_id
+
+        site = record.get('site')
+        if site is not None:
+            pending = self._pending.setdefault(site, {})
+            if record.get('pending'):
+                pending[doc_id] = filename
+            else:
+                pending.pop(doc_id, None)
+
+        match = self._pattern.match(filename)
+        if match is None:
+            return
+        template = (filename[:match.start('index')] + '{index}'
+                    + filename[match.end('index'):])
+        index = int(match.group('index')) + 1
+        if index > self._next_index.get(template, 0):
+            self._next_index[template] = index
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(config):
+    """
+    """
+
+    # Only load each index once per run.
+    path = config['OUTPUT_PATH']
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = OutputIndex(
+                path, config['OUTPUT_FILENAME'],
+                config['OUTPUT_INDEX_FILENAME'],
+                config['OUTPUT_SEGMENT_FILENAME'])
+        return _indexes[path]
+
+
+def _index_record(article, filename, offset=None):
+    """
+    """
+
+    # Just enough to find the file again and know whether it still needs
+    # its content scraped, without opening it.
+    url = article.url
+    if url:
+        url = canonical_url(url)
+    record = {
+        'doc_id': article.doc_id, 'filename': filename, 'url': url,
+        'site': article.pub_short or None, 'pending': article.pending
+    }
+    if offset is not None:
+        record['offset'] = offset
+    return record
+
+
+_duplicate_indexes = {}
+
+
+def get_duplicate_index(config, rebuild=False):
+    """
+    """
+
+    # Like the output index, one per output folder, loaded once per run.
+    filename = os.path.join(config['OUTPUT_PATH'], config['DEDUPE_FILENAME'])
+    with _indexes_lock:
+        if filename not in _duplicate_indexes:
+            _duplicate_indexes[filename] = DuplicateIndex(
+                filename, settings=config)
+            rebuild = rebuild or not os.path.exists(filename)
+        index = _duplicate_indexes[filename]
+
+    # Fingerprint whatever's already been saved, so new articles are checked
+    # against older runs too.
+    if rebuild:
+        index.rebuild(_get_fingerprints(config))
+    return index
+
+
+def _get_fingerprints(config):
+    """
+    """
+
+    for article in load_saved_articles(config):
+        words = article.content.split()
+        if (len(words) >= config['DEDUPE_LENGTH_MIN']
+                and article.duplicate_of is None):
+            yield article.doc_id, simhash(words)
+
+
+def check_duplicate(article, config):
+    """
+    """
+
+    log = getLogger(__name__)
+
+    # Very short texts all look alike, so leave them be.
+    words = article.content.split()
+    if len(words) < config['DEDUPE_LENGTH_MIN']:
+        return
+
+    original = get_duplicate_index(config).add(
+        article.doc_id, simhash(words))
+    if original is None:
+        article.duplicate_of = None
+        return
+
+    # Keep the file either way, so the URL isn't searched up and fetched
+    # again next time.
+    metrics.count('duplicates', article.pub_short)
+    article.duplicate_of = original
+    if config['DEDUPE_ACTION'] == 'drop':
+        log.warning(_('Dropping content (duplicate of %s): %s'),
+                    original, article.url)
+        article.content = ''
+    else:
+        log.warning(_('Duplicate of %s: %s'), original, article.url)
+
+
+_corpora = {}
+
+
+def get_corpus(config, rebuild=False):
+    """
+    """
+
+    # One database per output folder, filled from whatever's already there
+    # the first time, then kept up to date as articles are saved.
+    filename = os.path.join(config['OUTPUT_PATH'], config['CORPUS_FILENAME'])
+    with _indexes_lock:
+        if filename not in _corpora:
+            rebuild = rebuild or not os.path.exists(filename)
+            _corpora[filename] = CorpusIndex(filename)
+        corpus = _corpora[filename]
+
+    if rebuild:
+        count = corpus.rebuild(load_saved_articles(config))
+        getLogger(__name__).info(
+            _('Added %s articles to %s.'), count, filename)
+    return corpus
+
+
+def load_article(doc_id, config):
+    """
+    """
+
+    location = get_index(config).locate(doc_id)
+    if location is None:
+        return None
+    return _read_article(config, location)
+
+
+def load_saved_articles(config):
+    """
+    """
+
+    # The newest copy of every article, whichever way it was stored.
+    for doc_id, location in get_index(config).locations():
+        article = _read_article(config, location)
+        if article is not None:
+            yield article
+
+
+def _read_article(config, location):
+    """
+    """
+
+    filename, offset = location
+    full_filename = os.path.join(config['OUTPUT_PATH'], filename)
+    try:
+        if offset is not None:
+            return Article.from_dict(
+                segments.read_article(full_filename, offset))
+        with open(full_filename, 'r', encoding='utf-8') as infile:
+            return Article.from_dict(json.load(infile))
+    except (FileNotFoundError, EOFError, zlib.error):
+        return None
+
+
+_segment_stores = {}
+
+
+def get_segment_store(config):
+    """
+    """
+
+    path = config['OUTPUT_PATH']
+    with _indexes_lock:
+        if path not in _segment_stores:
+            _segment_stores[path] = segments.SegmentStore(
+                path, settings=config)
+        return _segment_stores[path]
+
+
+def export_articles(config, path):
+    """
+    """
+
+    log = getLogger(__name__)
+
+    # Write everything out one file per article, the way the rest of the
+    # WE1S pipeline expects, whatever format we've been saving in. This is
+    # just a save into another folder.
+    export_config = dict(config, OUTPUT_PATH=path, OUTPUT_FORMAT='files',
+                         DEDUPE_ENABLE=False, CORPUS_ENABLE=False)
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    count = 0
+    for article in load_saved_articles(config):
+        save_article(article, export_config)
+        count += 1
+    log.info(_('Exported %s articles to %s.'), count, path)
+    return count
+
+
 def save_article(article, config):
     """
     """
 
+    with metrics.timer('save', article.pub_short):
+        _save_article(article, config)
+        if config['CORPUS_ENABLE']:
+            get_corpus(config).update(article)
+    metrics.count('articles_saved', article.pub_short)
+
+
+def _save_article(article, config):
+    """
+    """
+
     log = getLogger(__name__)
     path = config['OUTPUT_PATH']
+    index = get_index(config)
+
+    # Catch the same text turning up again under another URL or on another
+    # site.
+    if config['DEDUPE_ENABLE'] and article.content:
+        check_duplicate(article, config)
+
+    if config['OUTPUT_FORMAT'] == 'segments':
+        _save_article_to_segment(article, config)
+        return
 
     # Update existing files first.
-    filename = ''
-    for json_data, json_file in load_json_files_from_path(path):
-        if json_data['doc_id'] == article['doc_id']:
-            filename = json_file
-            log.info(_('Saving (overwrite): %s'), filename)
-            break
+    location = index.locate(article.doc_id)
+    filename = None
+    if location is not None and location[1] is None:
+        filename = location[0]
+    if filename is not None:
+        log.info(_('Saving (overwrite): %s'), filename)
 
     # Otherwise make a new file.
-    if filename == '':
+    else:
 
         # Use Mirrormask timestamp format.
         now = time.localtime()
@@ -82,59 +537,130 @@ def save_article(article, config):
         # We want to store the search term in the filename if possible.
         # There might be a better way to do this--especially if we eventually
         # have to consider complex boolean search strings.
-        term = slugify(article['search_term'])
+        term = slugify(article.search_term)
 
-        filename = config['OUTPUT_FILENAME'].format(
+        template = config['OUTPUT_FILENAME'].format(
             index='{index}',
             timestamp=timestamp,
-            site=article['pub_short'],
+            site=article.pub_short,
             term=slugify(term)
         )
-
-        # Increment filenames.
-        for x in range(sys.maxsize):
-            temp_filename = filename.format(index=x)
-            if not os.path.exists(os.path.join(path, temp_filename)):
-                filename = temp_filename
-                break
-        
+        filename = index.reserve(article.doc_id, template)
         log.info(_('Saving: %s'), filename)
 
-    filename = os.path.join(path, filename)
-    with open(filename, 'w', encoding='utf-8') as outfile:
-        json.dump(article, outfile, ensure_ascii=False, indent=2)
+    # Write to a temporary file first so an interrupted save doesn't leave a
+    # broken JSON file behind.
+    full_filename = os.path.join(path, filename)
+    temp_filename = full_filename + '.tmp'
+    with open(temp_filename, 'w', encoding='utf-8') as outfile:
+        json.dump(article.to_dict(), outfile, ensure_ascii=False, indent=2)
+    os.replace(temp_filename, full_filename)
+    index.update(article, filename)
+
+
+def _save_article_to_segment(article, config):
+    """
+    """
+
+    log = getLogger(__name__)
+    index = get_index(config)
+
+    filename, offset = get_segment_store(config).write(article.to_dict())
+    log.info(_('Saving: %s (%s)'), filename, offset)
+
+    # If this article used to have a file of its own, the segment has the
+    # newer copy now, so don't leave the old one lying around.
+    location = index.locate(article.doc_id)
+    index.update(article, filename, offset)
+    if location is not None and location[1] is None:
+        try:
+            os.remove(os.path.join(config['OUTPUT_PATH'], location[0]))
+        except FileNotFoundError:
+            pass
+
+
+# Regex processing. Experimental!
+# This looks for:
+# - URL strings, common in blog posts, etc., and probably not useful for
+#   topic modelling.
+# - Irregular punctuation, i.e. punctuation left over from formatting
+#   or HTML symbols that Bleach missed.
+CLEAN_REGEX = r'http(.*?)\s|[^a-zA-Z0-9\s\.\,\!\"\'\-\:\;\p{Sc}]'
+
+# Text with none of these in it comes through Bleach untouched, so we can
+# skip it. That's most titles and most text pulled out of tags.
+_NEEDS_BLEACH = re.compile(
+    r'[<&\x00-\x08\x0b-\x1f\x7f-\x9f\p{Noncharacter_Code_Point}\p{Cs}]')
+
+# Everything in ASCII that isn't in string.printable, for str.translate.
+_UNPRINTABLE = {x: None for x in range(128) if chr(x) not in string.printable}
+
+_patterns = {}
+_cleaners = threading.local()  # Bleach cleaners aren't thread-safe.
 
 
 def clean_string(dirty_string, regex_string=None):
     """
     """
 
-    # Start by Bleaching out the HTML.
-    dirty_string = bleach.clean(dirty_string, tags=[], strip=True)
-    dirty_string = html.unescape(dirty_string)  # Get rid of &lt;, etc.
+    # Bleach and Unidecode are slow to import, so they wait until there's
+    # something to clean.
+    from unidecode import unidecode
+
+    # Start by Bleaching out the HTML. Setting up a Cleaner is expensive, so
+    # each thread keeps its own.
+    if _NEEDS_BLEACH.search(dirty_string):
+        cleaner = getattr(_cleaners, 'cleaner', None)
+        if cleaner is None:
+            import bleach
+            cleaner = _cleaners.cleaner = bleach.Cleaner(tags=[], strip=True)
+        dirty_string = cleaner.clean(dirty_string)
+        dirty_string = html.unescape(dirty_string)  # Get rid of &lt;, etc.
 
     # Ideally we shouldn't need this since all the content is being handled
     # "safely," but the LexisNexis import script does it, so we'll do it too
     # in case some other part of the process is expecting ASCII-only text.
     ascii_string = unidecode(dirty_string)
 
-    # Regex processing. Experimental!
-    # This looks for:
-    # - URL strings, common in blog posts, etc., and probably not useful for
-    #   topic modelling.
-    # - Irregular punctuation, i.e. punctuation left over from formatting
-    #   or HTML symbols that Bleach missed.
     if not regex_string:
-        regex_string = r'http(.*?)\s|[^a-zA-Z0-9\s\.\,\!\"\'\-\:\;\p{Sc}]'
-    ascii_string = re.sub(re.compile(regex_string), ' ', ascii_string)
-
-    ascii_string = ''.join([x for x in ascii_string if x in string.printable])
+        regex_string = CLEAN_REGEX
+    pattern = _patterns.get(regex_string)
+    if pattern is None:
+        pattern = _patterns[regex_string] = re.compile(regex_string)
+    ascii_string = pattern.sub(' ', ascii_string)
+
+    # Unidecode should only ever give us ASCII, but check before taking the
+    # shortcut.
+    if ascii_string.isascii():
+        ascii_string = ascii_string.translate(_UNPRINTABLE)
+    else:
+        ascii_string = ''.join(
+            [x for x in ascii_string if x in string.printable])
     ascii_string = ' '.join(ascii_string.split())
     ascii_string = ascii_string.replace(' .', '.')  # ??
 
     return ascii_string
 
 
+def clean_strings(dirty_strings, regex_string=None, processes=None):
+    """
+    """
+
+    # Small jobs aren't worth the cost of starting up more processes, but a
+    # big backfill can spread out over every core.
+    if not processes:
+        return [clean_string(x, regex_string) for x in dirty_strings]
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    dirty_strings = list(dirty_strings)
+    chunksize = max(1, len(dirty_strings) // (processes * 4))
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(
+            partial(clean_string, regex_string=regex_string),
+            dirty_strings, chunksize=chunksize))
+
+
 def slugify(title_string):
     """
     """
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import hashlib
+import json
+import os
+import threading
+from gettext import gettext as _
+from logging import getLogger
+
+BITS = 64  # Fingerprint size.
+SHINGLE_SIZE = 3  # Words per shingle.
+
+
+def simhash(words):
+    """
+    """
+
+    # Hash every run of a few words, then let each bit of the fingerprint
+    # be whatever most of the hashes say it is. Pages that share most of
+    # their text end up with fingerprints that differ in only a few bits.
+    words = [x.lower() for x in words]
+    if len(words) > SHINGLE_SIZE:
+        shingles = [' '.join(words[i:i + SHINGLE_SIZE])
+                    for i in range(len(words) - SHINGLE_SIZE + 1)]
+    else:
+        shingles = [' '.join(words)]
+
+    # Counting bits one hash at a time is slow in Python, so line the hashes
+    # up as strings of ones and zeros and count down each column instead.
+    rows = [format(int.from_bytes(hashlib.blake2b(
+        x.encode('utf-8'), digest_size=BITS // 8).digest(), 'big'),
+        '0{}b'.format(BITS)) for x in shingles]
+    half = len(rows) / 2
+    fingerprint = 0
+    for column in zip(*rows):
+        fingerprint = (fingerprint << 1) | (column.count('1') > half)
+    return fingerprint
+
+
+def get_distance(a, b):
+    """
+    """
+
+    return bin(a ^ b).count('1')
+
+
+class DuplicateIndex:
+    """
+    """
+
+    SIMILARITY = 0.9  # Share of fingerprint bits that have to agree.
+
+    def __init__(self, filename, settings=None):
+        """
+        """
+
+        self._log = getLogger(__name__)
+        self._lock = threading.Lock()
+
+        if settings is not None:
+            self.SIMILARITY = settings['DEDUPE_SIMILARITY']
+
+        # If two fingerprints are within this many bits of each other, then
+        # splitting them into one more band than that means at least one
+        # band has to match exactly. So we only ever compare against pages
+        # that share a band, never against everything.
+        self.distance = int(round((1 - self.SIMILARITY) * BITS))
+        bands = min(BITS, self.distance + 1)
+        self._bands = [(BITS * i // bands, BITS * (i + 1) // bands)
+                       for i in range(bands)]
+
+        self.filename = filename
+        self._fingerprints = {}  # doc_id -> fingerprint
+        self._buckets = {}  # (band, value) -> {doc_id: None}, in order
+
+        if os.path.exists(filename):
+            self.load()
+
+    def load(self):
+        """
+        """
+
+        self._log.debug(_('Loading fingerprints: %s'), self.filename)
+        with open(self.filename, 'r', encoding='utf-8') as infile:
+            for line in infile:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    self._log.warning(
+                        _('Bad fingerprint entry: %s'), line.strip())
+                    continue
+                self._add(record['doc_id'], int(record['simhash'], 16))
+
+    def rebuild(self, fingerprints):
+        """
+        """
+
+        self._log.info(_('Building fingerprints in %s.'), self.filename)
+        with self._lock:
+            self._fingerprints = {}
+            self._buckets = {}
+
+            temp_file = self.filename + '.tmp'
+            with open(temp_file, 'w', encoding='utf-8') as outfile:
+                for doc_id, fingerprint in fingerprints:
+                    if self._find(doc_id, fingerprint) is not None:
+                        continue
+                    self._add(doc_id, fingerprint)
+                    outfile.write(_fingerprint_record(doc_id, fingerprint))
+            os.replace(temp_file, self.filename)
+
+    def add(self, doc_id, fingerprint):
+        """
+        """
+
+        # Finding and adding happen together, so two copies saved at the
+        # same moment can't both think they were first.
+        with self._lock:
+            original = self._find(doc_id, fingerprint)
+            if original is not None:
+                return original
+
+            if self._fingerprints.get(doc_id) != fingerprint:
+                with open(self.filename, 'a', encoding='utf-8') as outfile:
+                    outfile.write(_fingerprint_record(doc_id, fingerprint))
+                self._add(doc_id, fingerprint)
+            return None
+
+    def _find(self, doc_id, fingerprint):
+        """
+        """
+
+        best, best_distance = None, self.distance + 1
+        for band in self._get_bands(fingerprint):
+            for candidate in self._buckets.get(band, {}):
+
+                # Buckets can hold old fingerprints for articles that have
+                # changed since, so always check against the current one.
+                if candidate == doc_id:
+                    continue
+                distance = get_distance(
+                    fingerprint, self._fingerprints[candidate])
+                if distance < best_distance:
+                    best, best_distance = candidate, distance
+        return best
+
+    def _add(self, doc_id, fingerprint):
+        """
+        """
+
+        self._fingerprints[doc_id] = fingerprint
+        for band in self._get_bands(fingerprint):
+            self._buckets.setdefault(band, {})[doc_id] = None
+
+    def _get_bands(self, fingerprint):
+        """
+        """
+
+        for i, (start, end) in enumerate(self._bands):
+            yield i, (fingerprint >> start) & ((1 << (end - start)) - 1)
+
+
+def _fingerprint_record(doc_id, fingerprint):
+    """
+    """
+
+    return json.dumps({'doc_id': doc_id,
+                       'simhash': format(fingerprint, '016x')}) + '\n'
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from gettext import gettext as _
+from logging import getLogger
+from urllib.error import HTTPError, URLError
+
+from we1schomp import metrics
+from we1schomp.cache import CacheMiss, ResponseCache
+from we1schomp.client import HttpClient, UnwantedResponse
+from we1schomp.ratelimit import RateLimiter
+
+
+class FetchEngine:
+    """
+    """
+
+    CONCURRENCY = 8  # Fetches in flight across all hosts.
+    RETRIES = 2  # Extra tries for pages that say "slow down" (429/503).
+
+    def __init__(self, settings=None, limiter=None, cache=None,
+                 client=None):
+        """
+        """
+
+        self._log = getLogger(__name__)
+
+        # Everything shares one client, so connections to each host are
+        # kept open and reused across fetches.
+        if client is None:
+            client = HttpClient(settings=settings)
+        self.client = client
+
+        if settings is not None:
+            self.CONCURRENCY = settings['FETCH_CONCURRENCY']
+            if cache is None and settings['CACHE_ENABLE']:
+                cache = ResponseCache(settings=settings, client=client)
+
+        # One limiter for everything, so it learns how fast each host can
+        # go from every request made to it.
+        if limiter is None:
+            filename = None
+            if settings is not None:
+                filename = os.path.join(
+                    settings['OUTPUT_PATH'], settings['RATE_FILENAME'])
+            limiter = RateLimiter(settings=settings, filename=filename)
+        self.limiter = limiter
+        self.cache = cache
+
+        self._executor = ThreadPoolExecutor(max_workers=self.CONCURRENCY)
+
+    def fetch(self, url, site=None, stage='fetch', accept=None):
+        """
+        """
+
+        # Nothing to be polite about if we're not going to the network.
+        if self.cache is not None and self.cache.OFFLINE:
+            with metrics.timer(stage, site):
+                return self.cache.fetch(url, accept)
+
+        for attempt in range(self.RETRIES + 1):
+            with self.limiter.slot(url):
+                self.limiter.wait(url)
+                self._log.info(_('Fetching: %s'), url)
+                start = time.monotonic()
+                try:
+                    with metrics.timer(stage, site):
+                        if self.cache is not None:
+                            response = self.cache.fetch(url, accept)
+                        else:
+                            response = self.client.get(url, accept=accept)
+                except (HTTPError, URLError) as e:
+                    if self._report_error(
+                            url, site, e, time.monotonic() - start, attempt):
+                        continue
+                    raise
+
+            self.limiter.report(url, response.status, time.monotonic() - start)
+            metrics.count('bytes_fetched', site, len(response.body))
+            return response
+
+    def stream(self, url, site=None, stage='fetch', size_max=None):
+        """
+        """
+
+        # Like fetch, but yields the body a piece at a time straight off the
+        # connection, for documents too big to want in memory all at once.
+        # These can't be cached, and the host's slot is held until the
+        # reader is done with it.
+        if self.cache is not None and self.cache.OFFLINE:
+            raise CacheMiss(_('Not in cache: %s') % url)
+
+        for attempt in range(self.RETRIES + 1):
+            with self.limiter.slot(url):
+                self.limiter.wait(url)
+                self._log.info(_('Fetching: %s'), url)
+                start = time.monotonic()
+                try:
+                    with metrics.timer(stage, site):
+                        response = self.client.open(url, size_max=size_max)
+                    self.limiter.report(
+                        url, response.status, time.monotonic() - start)
+                    size = 0
+                    for chunk in response.chunks:
+                        size += len(chunk)
+                        yield chunk
+                    metrics.count('bytes_fetched', site, size)
+                    return
+                except (HTTPError, URLError) as e:
+                    if self._report_error(
+                            url, site, e, time.monotonic() - start, attempt):
+                        continue
+                    raise
+
+    def _report_error(self, url, site, error, elapsed, attempt):
+        """
+        """
+
+        # Tell the limiter how it went. Returns True if it's worth another
+        # try after a "slow down".
+        if isinstance(error, HTTPError):
+            metrics.count('fetch_errors', site)
+            self.limiter.report(
+                url, error.code, elapsed, error.headers.get('retry-after'))
+            if error.code in (429, 503) and attempt < self.RETRIES:
+                self._log.warning(_('Slowing down for %s.'), url)
+                return True
+        elif isinstance(error, UnwantedResponse):
+            # The server's fine, we just don't want this page.
+            metrics.count('fetch_skipped', site)
+            self.limiter.report(url, error.status, elapsed)
+        else:
+            metrics.count('fetch_errors', site)
+            self.limiter.report(url, None, elapsed)
+        return False
+
+    def fetch_all(self, items, url=None, limit=None, fallback=None,
+                  site=None, stage='fetch', accept=None):
+        """
+        """
+
+        # By default the items are the URLs themselves, but we usually want
+        # to pass articles through and get them back alongside their pages.
+        if url is None:
+            url = lambda item: item  # noqa: E731
+
+        items = iter(items)
+        futures = {}
+
+        def submit_next():
+            for item in items:
+                future = self._executor.submit(
+                    self._fetch_or_fallback, url(item), fallback, site,
+                    stage, accept)
+                futures[future] = item
+                return True
+            return False
+
+        # Keep a couple of fetches queued up behind each worker so there's
+        # always something ready to go, without reading the whole list in
+        # at once. Callers can ask for fewer than that.
+        if limit is None:
+            limit = self.CONCURRENCY * 2
+
+        try:
+            for i in range(limit):
+                if not submit_next():
+                    break
+
+            while futures:
+                done, pending = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = futures.pop(future)
+                    submit_next()
+                    try:
+                        yield item, future.result(), None
+                    except (HTTPError, URLError) as e:
+                        yield item, None, e
+
+        # If whoever's reading stops early, don't leave fetches running.
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _fetch_or_fallback(self, url, fallback, site, stage, accept):
+        """
+        """
+
+        # Some pages only load in a real browser. Those get a second try
+        # with the fallback, if there is one, on this same worker thread.
+        try:
+            return self.fetch(url, site, stage, accept)
+        except (CacheMiss, UnwantedResponse):
+            raise
+        except (HTTPError, URLError) as e:
+            if fallback is None:
+                raise
+            self._log.debug(_('URLLib Error: %s'), e)
+
+        # The browser waits its turn like any other request. Otherwise a
+        # site that turns us away would get a burst of page loads instead.
+        with self.limiter.slot(url):
+            self.limiter.wait(url)
+            start = time.monotonic()
+            try:
+                with metrics.timer('browser_fetch', site):
+                    response = fallback(url)
+            except URLError:
+                self.limiter.report(url, None, time.monotonic() - start)
+                raise
+        self.limiter.report(url, response.status, time.monotonic() - start)
+        return response
+
+    def close(self):
+        """
+        """
+
+        self._executor.shutdown(wait=False)
+        self.client.close()
+        self.limiter.save()
+
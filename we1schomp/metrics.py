@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from gettext import gettext as _
+from logging import getLogger
+
+# Upper bounds, in seconds, of the histogram buckets for stage timings.
+BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+           10.0, 30.0, 60.0, float('inf')]
+
+
+class Histogram:
+    """
+    """
+
+    def __init__(self):
+        """
+        """
+
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        """
+        """
+
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction):
+        """
+        """
+
+        # Good to within a bucket, which is all we need to see where the
+        # time is going.
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    """
+    """
+
+    PROMETHEUS_FILE = ''  # Leave blank to turn off.
+    JSON_FILE = ''  # Leave blank to turn off.
+    INTERVAL = 10.0  # Seconds between Prometheus file updates.
+
+    def __init__(self, settings=None):
+        """
+        """
+
+        self._log = getLogger(__name__)
+        self._lock = threading.Lock()
+
+        if settings is not None:
+            self.PROMETHEUS_FILE = settings['METRICS_PROMETHEUS_FILE']
+            self.JSON_FILE = settings['METRICS_JSON_FILE']
+            self.INTERVAL = settings['METRICS_INTERVAL']
+
+        self.started = time.time()
+        self._histograms = {}  # (stage, site) -> Histogram
+        self._counters = {}  # (name, site) -> count
+        self._last_export = time.monotonic()
+        self._json_file = None
+        if self.JSON_FILE:
+            self._json_file = open(self.JSON_FILE, 'a', encoding='utf-8')
+
+    @contextmanager
+    def timer(self, stage, site=None):
+        """
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, site, time.perf_counter() - start)
+
+    def observe(self, stage, site, seconds):
+        """
+        """
+
+        key = (stage, site or '')
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram()
+            self._histograms[key].observe(seconds)
+            if self._json_file is not None:
+                self._json_file.write(json.dumps({
+                    'time': time.time(), 'stage': stage, 'site': site,
+                    'seconds': round(seconds, 6)}) + '\n')
+        self._maybe_export()
+
+    def count(self, name, site=None, amount=1):
+        """
+        """
+
+        key = (name, site or '')
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def summary(self):
+        """
+        """
+
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        elapsed = time.time() - self.started
+
+        lines = [_('Run time: %.1f seconds.') % elapsed, '']
+        lines.append('{:<14} {:<24} {:>8} {:>10} {:>8} {:>8} {:>8}'.format(
+            _('Stage'), _('Site'), _('Count'), _('Total (s)'), _('p50'),
+            _('p99'), _('Per sec')))
+        for (stage, site), histogram in histograms:
+            lines.append(
+                '{:<14} {:<24} {:>8} {:>10.2f} {:>8.3f} {:>8.3f} {:>8.2f}'
+                .format(stage, site[:24], histogram.count, histogram.total,
+                        histogram.percentile(0.5), histogram.percentile(0.99),
+                        histogram.count / elapsed if elapsed else 0))
+        if counters:
+            lines.append('')
+            for (name, site), count in counters:
+                lines.append('{:<39} {:>8}'.format(
+                    '{} {}'.format(name, site).strip()[:39], count))
+        return '\n'.join(lines)
+
+    def snapshot(self):
+        """
+        """
+
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        return {
+            'stages': [{
+                'stage': stage, 'site': site, 'count': histogram.count,
+                'total': round(histogram.total, 6),
+                'p50': histogram.percentile(0.5),
+                'p99': histogram.percentile(0.99)
+            } for (stage, site), histogram in histograms],
+            'counters': [{'name': name, 'site': site, 'count': count}
+                         for (name, site), count in counters]
+        }
+
+    def export(self):
+        """
+        """
+
+        if not self.PROMETHEUS_FILE:
+            return
+
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        lines = ['# TYPE we1schomp_stage_seconds histogram']
+        for (stage, site), histogram in histograms:
+            labels = 'stage="{}",site="{}"'.format(stage, site)
+            seen = 0
+            for bound, count in zip(BUCKETS, histogram.buckets):
+                seen += count
+                lines.append('we1schomp_stage_seconds_bucket{{{},le="{}"}} {}'
+                             .format(labels, _prometheus_bound(bound), seen))
+            lines.append('we1schomp_stage_seconds_sum{{{}}} {}'.format(
+                labels, histogram.total))
+            lines.append('we1schomp_stage_seconds_count{{{}}} {}'.format(
+                labels, histogram.count))
+        lines.append('# TYPE we1schomp_events_total counter')
+        for (name, site), count in counters:
+            lines.append('we1schomp_events_total{{name="{}",site="{}"}} {}'
+                         .format(name, site, count))
+
+        # Prometheus' file collector might read this at any moment, so
+        # don't let it see half a file.
+        temp_filename = self.PROMETHEUS_FILE + '.tmp'
+        with open(temp_filename, 'w', encoding='utf-8') as outfile:
+            outfile.write('\n'.join(lines) + '\n')
+        os.replace(temp_filename, self.PROMETHEUS_FILE)
+
+    def close(self):
+        """
+        """
+
+        self.export()
+        with self._lock:
+            if self._json_file is not None:
+                self._json_file.close()
+                self._json_file = None
+
+    def _maybe_export(self):
+        """
+        """
+
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_export < self.INTERVAL:
+                return
+            self._last_export = now
+            if self._json_file is not None:
+                self._json_file.flush()
+        self.export()
+
+
+def _prometheus_bound(bound):
+    """
+    """
+
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+# Everything reports to the same place, the same way everything logs to the
+# same place. The app swaps in one built from the settings at start-up.
+_metrics = Metrics()
+
+
+def configure(settings):
+    """
+    """
+
+    global _metrics
+    _metrics = Metrics(settings=settings)
+    return _metrics
+
+
+def get_metrics():
+    """
+    """
+
+    return _metrics
+
+
+def timer(stage, site=None):
+    """
+    """
+
+    return _metrics.timer(stage, site)
+
+
+def count(name, site=None, amount=1):
+    """
+    """
+
+    _metrics.count(name, site, amount)
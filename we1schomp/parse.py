@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+from gettext import gettext as _
+from logging import getLogger
+
+# Parsers BeautifulSoup knows about, fastest first. html5lib is by far the
+# slowest, but it's also the most forgiving with broken markup.
+PARSERS = ['lxml', 'html.parser', 'html5lib']
+
+_available = {}
+
+
+def make_soup(markup, parser='lxml', only=None):
+    """
+    """
+
+    # BeautifulSoup is slow to import, so wait until there's something to
+    # parse.
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    parser = get_parser(parser)
+
+    # html5lib always builds the whole tree, so don't bother it with a
+    # strainer it'll only warn about.
+    if only is None or parser == 'html5lib':
+        return BeautifulSoup(markup, parser)
+    if not isinstance(only, SoupStrainer):
+        only = SoupStrainer(only)
+    return BeautifulSoup(markup, parser, parse_only=only)
+
+
+def get_parser(parser):
+    """
+    """
+
+    # lxml is an optional install, so fall back to the next best parser we
+    # have if it's missing. Only check once for each parser.
+    if parser not in _available:
+        from bs4 import BeautifulSoup, FeatureNotFound
+        try:
+            BeautifulSoup('', parser)
+            _available[parser] = parser
+        except FeatureNotFound:
+            fallback = 'html5lib'
+            if parser in PARSERS:
+                for other in PARSERS[PARSERS.index(parser) + 1:]:
+                    if get_parser(other) == other:
+                        fallback = other
+                        break
+            getLogger(__name__).warning(
+                _('Parser "%s" not available, using "%s".'), parser, fallback)
+            _available[parser] = fallback
+    return _available[parser]
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from gettext import gettext as _
+from logging import getLogger
+from urllib.parse import urlsplit
+
+
+class RateLimiter:
+    """
+    """
+
+    CONCURRENCY_PER_HOST = 2  # Requests in flight for any one host.
+    DELAY_START = 1.0  # Seconds between requests to a host we don't know.
+    DELAY_MIN = 0.25
+    DELAY_MAX = 60.0
+    SLOW_RESPONSE = 5.0  # Responses slower than this count as a warning.
+    SPEEDUP = 0.1  # Seconds taken off the delay after a healthy response.
+    BACKOFF = 2.0  # What the delay gets multiplied by when a host struggles.
+    SAVE_EVERY = 50  # Responses between saving what we've learned.
+
+    def __init__(self, settings=None, filename=None):
+        """
+        """
+
+        self._log = getLogger(__name__)
+
+        if settings is not None:
+            self.CONCURRENCY_PER_HOST = settings['FETCH_CONCURRENCY_PER_HOST']
+            self.DELAY_START = settings['RATE_DELAY_START']
+            self.DELAY_MIN = settings['RATE_DELAY_MIN']
+            self.DELAY_MAX = settings['RATE_DELAY_MAX']
+            self.SLOW_RESPONSE = settings['RATE_SLOW_RESPONSE']
+
+        self._lock = threading.Lock()
+        self._host_slots = {}  # host -> Semaphore
+        self._host_next = {}  # host -> earliest time for the next request
+        self._delays = {}  # host -> current delay
+        self._reports = 0
+
+        # Start each host off at whatever speed it ended up at last time.
+        self.filename = filename
+        if filename is not None and os.path.exists(filename):
+            with open(filename, 'r', encoding='utf-8') as infile:
+                self._delays = json.load(infile)
+            self._log.debug(
+                _('Loaded rates for %s hosts.'), len(self._delays))
+
+    def wait(self, url, minimum=0.0):
+        """
+        """
+
+        # Claim the next open slot for this host, then sleep until it comes
+        # up. Requests to different hosts never wait on each other, so when
+        # several sites are running at once their delays overlap.
+        host = get_host(url)
+        with self._lock:
+            delay = max(minimum, self._delays.get(host, self.DELAY_START))
+            now = time.monotonic()
+            start = max(now, self._host_next.get(host, now))
+            self._host_next[host] = start + random.uniform(
+                delay * 0.8, delay * 1.2)
+
+        if start > now:
+            self._log.debug(
+                _('Waiting %.2f seconds for %s.'), start - now, host)
+            time.sleep(start - now)
+
+    def slot(self, url):
+        """
+        """
+
+        host = get_host(url)
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(
+                    self.CONCURRENCY_PER_HOST)
+            return self._host_slots[host]
+
+    def report(self, url, status=None, elapsed=0.0, retry_after=None):
+        """
+        """
+
+        # Speed up a little at a time while a host is happy, and back off
+        # hard as soon as it isn't. A status of None means we didn't get a
+        # response at all. A 403 is usually a site blocking us, so that
+        # counts as unhappy. Other 4xx are about the page, not the host,
+        # so they don't change anything.
+        host = get_host(url)
+        with self._lock:
+            delay = self._delays.get(host, self.DELAY_START)
+
+            if status is None or status in (403, 429) or status >= 500:
+                delay *= self.BACKOFF
+            elif elapsed > self.SLOW_RESPONSE:
+                delay *= (1 + self.BACKOFF) / 2
+            elif status < 400:
+                delay -= self.SPEEDUP
+            delay = min(self.DELAY_MAX, max(self.DELAY_MIN, delay))
+
+            # If the server told us how long to wait, do as we're told.
+            wait = get_retry_after(retry_after)
+            if wait is not None:
+                wait = min(self.DELAY_MAX, wait)
+                delay = max(delay, wait)
+                self._host_next[host] = max(
+                    self._host_next.get(host, 0), time.monotonic() + wait)
+
+            if delay != self._delays.get(host):
+                self._log.debug(
+                    _('Delay for %s is now %.2f seconds.'), host, delay)
+            self._delays[host] = delay
+
+            self._reports += 1
+            save = self._reports % self.SAVE_EVERY == 0
+        if save:
+            self.save()
+
+    def save(self):
+        """
+        """
+
+        if self.filename is None:
+            return
+        with self._lock:
+            temp_filename = self.filename + '.tmp'
+            with open(temp_filename, 'w', encoding='utf-8') as outfile:
+                json.dump({host: round(delay, 3)
+                           for host, delay in self._delays.items()},
+                          outfile, indent=2, sort_keys=True)
+            os.replace(temp_filename, self.filename)
+
+
+def get_host(url):
+    """
+    """
+
+    # Accept bare hosts ("example.com") as well as full URLs.
+    if '//' not in url:
+        url = '//' + url
+    return urlsplit(url).netloc.lower()
+
+
+def get_retry_after(value):
+    """
+    """
+
+    # Retry-After can be a number of seconds or an HTTP date.
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
@@ -6,16 +6,20 @@ import random
 import time
 from gettext import gettext as _
 from logging import getLogger
-from urllib.error import HTTPError, URLError
-from urllib.request import urlopen
-from uuid import uuid4
 
-from bs4 import BeautifulSoup
+from we1schomp import data, metrics
+from we1schomp.article import Article
+from we1schomp.cache import CacheMiss
+from we1schomp.client import UnwantedResponse
+from we1schomp.fetch import FetchEngine
+from we1schomp.parse import make_soup
+from we1schomp.urls import canonical_url
 
-from we1schomp import data
+# Pages worth parsing for article text.
+HTML_TYPES = ('text/html', 'application/xhtml+xml')
 
 
-def get_urls(site, config, browser):
+def get_urls(site, config, browser, state=None):
     """
     """
 
@@ -25,14 +29,39 @@ def get_urls(site, config, browser):
         log.warning(_('Google disabled for %s.'), site['name'])
         return []
 
+    index = data.get_index(config)
+
     for term in site['terms']:
 
-        log.info(
-            _('Starting Google search for "%s" at %s.'), term, site['name'])
+        # Pick up where we left off, if we've been here before.
+        position = None
+        if state is not None:
+            position = state.get_serp(site['short_name'], term)
+        if position is not None and position['done']:
+            log.info(_('Skipping (already searched): "%s" at %s.'),
+                     term, site['name'])
+            continue
+
+        if position is not None:
+            log.info(_('Resuming Google search for "%s" at %s (page %s).'),
+                     term, site['name'], position['page'])
+            page = position['page']
+            url = position['url']
 
         # Start the query.
-        browser.go(config['GOOGLE_QUERY_URL'].format(
-            site=site['url'], term=term))
+        else:
+            log.info(_('Starting Google search for "%s" at %s.'),
+                     term, site['name'])
+            page = 1
+            url = config['GOOGLE_QUERY_URL'].format(
+                site=site['url'], term=term,
+                num=config['GOOGLE_RESULTS_PER_PAGE'])
+
+        # Every page load waits its turn, the first one included, or the
+        # first "next page" after it would go straight through.
+        browser.sleep(url=url)
+        with metrics.timer('serp_load', site['short_name']):
+            browser.go(url)
 
         # Start the page loop. Each page has multiple results, so we'll have
         # a lot of nested loops here.
@@ -40,23 +69,51 @@ def get_urls(site, config, browser):
 
             browser.captcha_check()
 
-            soup = BeautifulSoup(browser.source, 'html5lib')
-            for rc in soup.find_all('div', {'class': 'rc'}):
+            # Remember which page we're on. If we stop partway through it,
+            # we'll do it again, but duplicates get merged anyway.
+            if state is not None:
+                state.set_serp(
+                    site['short_name'], term, page, browser.current_url)
+
+            with metrics.timer('serp_parse', site['short_name']):
+                results = get_serp_results(browser.source, site)
+
+            # Google orders results by relevance, not date, so a page with
+            # nothing new on it doesn't mean the later pages are all known
+            # too. Stopping there is a trade: fewer result pages (and fewer
+            # CAPTCHAs) on repeat searches, at the risk of missing a few.
+            # It's what googleStopOnKnown asks for; turn it off to go
+            # through every page.
+            known, new = 0, 0
+            for rc in results:
 
                 link = rc.find('a')
                 url = str(link.get('href')).lower()
 
                 # Drop results that include stop words.
-                stop_flag = False
-                for stop in site['google_stopwords']:
-                    if stop in url:
-                        log.warning(
-                            _('Skipping (stopword "%s"): %s'), stop, url)
-                        stop_flag = True
-                        break
-                if stop_flag:
+                stop = site['stopwords'].match(url)
+                if stop is not None:
+                    log.warning(_('Skipping (stopword "%s"): %s'), stop, url)
                     continue
 
+                # The same page turns up again under other search terms,
+                # or with a slightly different URL. Keep a single copy and
+                # note every term that found it.
+                doc_id = index.find_url(url)
+                if doc_id is not None:
+                    article = data.load_article(doc_id, config)
+                    if article is not None:
+                        terms = article.search_terms or [article.search_term]
+                        if term in terms:
+                            log.info(_('Skipping (duplicate): %s'), url)
+                            known += 1
+                            continue
+                        log.info(_('Duplicate (adding "%s"): %s'), term, url)
+                        article.search_terms = terms + [term]
+                        new += 1
+                        yield article
+                        continue
+
                 # Sometimes the link's URL gets mushed in with the text.
                 title = data.clean_string(str(link.text).split('http')[0])
 
@@ -71,105 +128,199 @@ def get_urls(site, config, browser):
                     date = 'N.D.'
                     log.warning(_('Ok (no date): %s'), url)
                 
-                article = {
-                    'doc_id': str(uuid4()),
-                    'attachment_id': '',
-                    'namespace': config['NAMESPACE'],
-                    'name': config['DB_NAME'].format(
-                        site=site['short_name'],
-                        term=data.slugify(term),
-                        slug=data.slugify(title)),
-                    'metapath': config['METAPATH'].format(
-                        site=site['short_name']),
-                    'pub': site['name'],
-                    'pub_date': date,
-                    'pub_short': site['short_name'],
-                    'title': title,
-                    'url': url,
-                    'content': '',
-                    'length': '',
-                    'search_term': term
-                }
-                yield article
-
-            browser.sleep()
-            if browser.click_on_id('pnnext'):
+                new += 1
+                yield Article(
+                    url=url, title=title, pub=site['name'],
+                    pub_short=site['short_name'], pub_date=date,
+                    search_term=term, search_terms=[term], config=config)
+
+            if config['GOOGLE_STOP_ON_KNOWN'] and known and not new:
+                log.info(_('Nothing new on page %s, stopping.'), page)
+                next_page = False
+            else:
+                browser.sleep()
+                with metrics.timer('serp_load', site['short_name']):
+                    next_page = browser.click_on_id('pnnext')
+            if next_page:
                 log.info(_('Going to next page.'))
+                page += 1
             else:
                 log.info(_('No more result pages.'))
+                if state is not None:
+                    state.set_serp(site['short_name'], term, page,
+                                   browser.current_url, done=True)
                 break
 
     log.info(_('Google search complete.'))
 
 
-def get_content(site, config, browser):
+def get_serp_results(markup, site):
+    """
+    """
+
+    from bs4 import SoupStrainer
+
+    rc = SoupStrainer('div', {'class': 'rc'})
+    soup = make_soup(markup, site['html_parser'], only=rc)
+    results = soup.find_all(rc)
+    if (results == [] and site['html_parser_fallback']
+            and site['html_parser_fallback'] != site['html_parser']):
+        soup = make_soup(markup, site['html_parser_fallback'], only=rc)
+        results = soup.find_all(rc)
+    return results
+
+
+def get_content(site, config, browser, fetcher=None, state=None, pool=None):
     """
     """
 
     log = getLogger(__name__)
 
-    # Get all the articles associated with this site.
-    articles = [a for a in data.load_articles(config['OUTPUT_PATH'])
-                if a['pub_short'] == site['short_name']]
-    if articles == []:
-        log.warning(_('No articles found for %s.'), site['name'])
-    else:
-        log.info(_('Beginning scrape of %s.'), site['name'])
-
-    for article in articles:
-
-        # Drop results that include stop words.
-        stop_flag = False
-        for stop in site['google_stopwords']:
-            if stop in article['url'].lower():
-                log.warning(
-                    _('Skipping (stopword "%s"): %s'), stop, article['url'])
-                stop_flag = True
-                break
-        if stop_flag:
+    close_fetcher = fetcher is None
+    if fetcher is None:
+        fetcher = FetchEngine(settings=config)
+
+    # Get all the articles associated with this site. These are read in as
+    # we go, not all up front.
+    log.info(_('Beginning scrape of %s.'), site['name'])
+    articles = data.load_pending_articles(site['short_name'], config)
+    count = 0
+
+    # Drop results that include stop words, and never fetch the same page
+    # twice, even if older runs left duplicates behind.
+    seen = set()
+    offline = fetcher.cache is not None and fetcher.cache.OFFLINE
+
+    def not_stopped(article):
+        url = canonical_url(article.url)
+        if url in seen:
+            log.warning(_('Skipping (duplicate): %s'), article.url)
+            return False
+        seen.add(url)
+        if (state is not None and state.get_attempts(article.url)
+                >= config['FETCH_ATTEMPTS_MAX']):
+            log.warning(_('Skipping (gave up after %s tries): %s'),
+                        config['FETCH_ATTEMPTS_MAX'], article.url)
+            return False
+        stop = site['stopwords'].match(article.url)
+        if stop is not None:
+            log.warning(
+                _('Skipping (stopword "%s"): %s'), stop, article.url)
+            return False
+        if state is not None and not offline:
+            state.start_fetch(article.url, site['short_name'])
+        return True
+
+    # Pages come back in whatever order they finish downloading, not the
+    # order we asked for them.
+    #
+    # If there's a browser pool, pages that won't load over plain HTTP are
+    # retried in one of its browsers as part of the fetch. Otherwise they
+    # wait their turn for the main browser.
+    fetches = fetcher.fetch_all(
+        filter(not_stopped, articles), url=lambda a: a.url,
+        fallback=None if pool is None else pool.fetch,
+        site=site['short_name'], accept=HTML_TYPES)
+    for article, response, error in fetches:
+
+        if error is None:
+            markup = response.text
+        elif isinstance(error, CacheMiss):
+            log.warning(_('Skipping (offline): %s'), article.url)
             continue
-        
-        browser.sleep()
-
-        try:
-            with urlopen(article['url']) as result:
-                soup = BeautifulSoup(result.read(), 'html5lib')
-        except (HTTPError, URLError) as e:
-            log.debug(_('URLLib Error: %s'), e)
-            browser.go(article['url'])
-            soup = BeautifulSoup(browser.source, 'html5lib')
-        
-        # Start by getting rid of JavaScript--Bleach will "neuter" this but
-        # has trouble removing it.
-        try:
-            soup.script.extract()
-        except AttributeError:
-            log.debug(_('No <script> tags found.'))
-
-        # Now focus in on the content. We can't guarantee they've used the
-        # <article> tag, but it's a safe bet they won't put an article in the
-        # <header> or <footer>.
-        try:
-            soup.header.extract()
-            soup.footer.extract()
-        except AttributeError:
-            log.debug(_('No <header>/<footer> tags found.'))
-
-        # Finally, take all the content tags, default <p>, and mush together
-        # any that are over a certain length of characters. This can be very
-        # imprecise, but it seems to work for the most part. If we're getting
-        # particularly bad content for a site, we can tweak the config and
-        # try again or switch to a more advanced web-scraping tool.
-        content = ''
-        for tag in soup.find_all(site['content_tag']):
-            if len(tag.text) > site['content_length_min']:
-                content += ' ' + tag.text
-        content = data.clean_string(content)
-
-        article.update({
-            'content': content,
-            'length': f"{len(content.split(' '))} words"
-        })
+        elif isinstance(error, UnwantedResponse):
+            # PDFs, images and other things that slipped past the stopwords.
+            # A browser won't do any better with them.
+            log.warning(_('Skipping (%s)'), error.reason)
+            if state is not None:
+                state.set_fetch(
+                    article.url, site['short_name'], 'skipped', error)
+            continue
+        elif pool is not None:
+            log.debug(_('Browser Error: %s'), error)
+            log.warning(_('Skipping (could not load): %s'), article.url)
+            if state is not None:
+                state.set_fetch(
+                    article.url, site['short_name'], 'failed', error)
+            continue
+        else:
+            log.debug(_('URLLib Error: %s'), error)
+            with browser.lock:
+                browser.sleep(url=article.url)
+                with metrics.timer('browser_fetch', site['short_name']):
+                    browser.go(article.url)
+                    markup = browser.source
+
+        # The fast parsers sometimes choke on really broken markup, so if we
+        # come up empty, give the slow-but-careful one a try.
+        content = get_article_content(markup, site, site['html_parser'])
+        if (content == '' and site['html_parser_fallback']
+                and site['html_parser_fallback'] != site['html_parser']):
+            log.debug(_('No content, trying %s: %s'),
+                      site['html_parser_fallback'], article.url)
+            content = get_article_content(
+                markup, site, site['html_parser_fallback'])
+
+        article.content = content
+        if state is not None:
+            state.set_fetch(article.url, site['short_name'],
+                            'done' if content else 'empty', error)
+        count += 1
         yield article
 
+    if count == 0:
+        log.warning(_('No articles found for %s.'), site['name'])
+
+    if close_fetcher:
+        fetcher.close()
     log.info(_('Scrape complete.'))
+
+
+def get_article_content(markup, site, parser):
+    """
+    """
+
+    # We only ever look at these tags, so don't build the rest of the tree.
+    with metrics.timer('parse', site['short_name']):
+        soup = make_soup(markup, parser, only=[
+            site['content_tag'], 'script', 'header', 'footer'])
+
+    with metrics.timer('extract', site['short_name']):
+        content = extract_content(soup, site)
+
+    with metrics.timer('clean', site['short_name']):
+        return data.clean_string(content)
+
+
+def extract_content(soup, site):
+    """
+    """
+
+    log = getLogger(__name__)
+
+    # Start by getting rid of JavaScript--Bleach will "neuter" this but
+    # has trouble removing it.
+    try:
+        soup.script.extract()
+    except AttributeError:
+        log.debug(_('No <script> tags found.'))
+
+    # Now focus in on the content. We can't guarantee they've used the
+    # <article> tag, but it's a safe bet they won't put an article in the
+    # <header> or <footer>.
+    try:
+        soup.header.extract()
+        soup.footer.extract()
+    except AttributeError:
+        log.debug(_('No <header>/<footer> tags found.'))
+
+    # Finally, take all the content tags, default <p>, and mush together
+    # any that are over a certain length of characters. This can be very
+    # imprecise, but it seems to work for the most part. If we're getting
+    # particularly bad content for a site, we can tweak the config and
+    # try again or switch to a more advanced web-scraping tool.
+    content = ''
+    for tag in soup.find_all(site['content_tag']):
+        if len(tag.text) > site['content_length_min']:
+            content += ' ' + tag.text
+    return content
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import itertools
+import zlib
+from gettext import gettext as _
+from logging import getLogger
+from urllib.error import HTTPError, URLError
+from urllib.parse import unquote, urljoin, urlsplit
+from xml.etree import ElementTree
+
+import regex as re
+
+from we1schomp import data
+from we1schomp.article import Article
+from we1schomp.fetch import FetchEngine
+from we1schomp.urls import canonical_url
+
+SIZE_MAX = 50 * 1024 * 1024  # The sitemap protocol's limit, uncompressed.
+DEPTH_MAX = 3  # How far to follow sitemap indexes into other indexes.
+
+# Elements that make up one entry in a sitemap, sitemap index or feed.
+SITEMAP = 'sitemap'
+ENTRIES = ('url', 'item', 'entry')
+
+_NOT_WORDS = re.compile(r'[^\p{L}\p{N}]+')
+
+
+def get_urls(site, config, fetcher=None):
+    """
+    """
+
+    log = getLogger(__name__)
+
+    close_fetcher = fetcher is None
+    if fetcher is None:
+        fetcher = FetchEngine(settings=config)
+
+    index = data.get_index(config)
+    base_url = 'http://' + site['url'].strip('/') + '/'
+    terms = [(term, ' {} '.format(get_words(term))) for term in site['terms']]
+    seen = set()
+    count = 0
+
+    # Sitemaps first, then feeds. Sitemap indexes just add more sitemaps to
+    # the end of the list.
+    sitemaps = [(urljoin(base_url, x), 0) for x in site['sitemap_urls']]
+    if sitemaps == []:
+        sitemaps = [(x, 0) for x in get_robots_sitemaps(
+            base_url, site, fetcher)]
+    documents = sitemaps + [
+        (urljoin(base_url, x), 0) for x in site['feed_urls']]
+
+    log.info(_('Starting sitemap search at %s.'), site['name'])
+    while documents:
+        document_url, depth = documents.pop(0)
+        if document_url in seen:
+            continue
+        seen.add(document_url)
+
+        for tag, fields in get_entries(document_url, site, fetcher):
+
+            if tag == SITEMAP:
+                if depth < DEPTH_MAX and fields.get('loc'):
+                    documents.append((fields['loc'].strip(), depth + 1))
+                continue
+
+            url = (fields.get('loc') or fields.get('link') or '').strip()
+            if not url:
+                continue
+            canonical = canonical_url(url)
+            if canonical in seen:
+                continue
+            seen.add(canonical)
+
+            # Drop results that include stop words.
+            stop = site['stopwords'].match(url)
+            if stop is not None:
+                log.debug(_('Skipping (stopword "%s"): %s'), stop, url)
+                continue
+
+            # Keep pages that mention one of our terms in their address,
+            # title or summary. That's the best a sitemap can do in place of
+            # a search.
+            title = data.clean_string(fields.get('title') or '')
+            text = ' {} '.format(get_words(' '.join([
+                unquote(urlsplit(url).path), title,
+                fields.get('description') or fields.get('summary') or ''])))
+            found = [term for term, words in terms if words in text]
+            if found == []:
+                continue
+
+            # The same page may have come from a search already.
+            doc_id = index.find_url(url)
+            if doc_id is not None:
+                article = data.load_article(doc_id, config)
+                if article is not None:
+                    known = article.search_terms or [article.search_term]
+                    new_terms = [x for x in found if x not in known]
+                    if new_terms == []:
+                        log.info(_('Skipping (duplicate): %s'), url)
+                        continue
+                    log.info(_('Duplicate (adding %s): %s'),
+                             ', '.join(new_terms), url)
+                    article.search_terms = known + new_terms
+                    yield article
+                    continue
+
+            log.info(_('Ok: %s'), url)
+            count += 1
+            yield Article(
+                url=url, title=title or get_title_from_url(url),
+                pub=site['name'], pub_short=site['short_name'],
+                pub_date=(fields.get('publication_date')
+                          or fields.get('pubdate') or fields.get('published')
+                          or fields.get('lastmod') or fields.get('updated')
+                          or 'N.D.').strip(),
+                search_term=found[0], search_terms=found, config=config)
+
+    if count == 0:
+        log.warning(_('No sitemap results for %s.'), site['name'])
+
+    if close_fetcher:
+        fetcher.close()
+    log.info(_('Sitemap search complete.'))
+
+
+def get_robots_sitemaps(base_url, site, fetcher):
+    """
+    """
+
+    log = getLogger(__name__)
+
+    # Sites list their sitemaps in robots.txt. If there aren't any, try the
+    # usual place.
+    robots_url = urljoin(base_url, '/robots.txt')
+    sitemaps = []
+    try:
+        response = fetcher.fetch(robots_url, site['short_name'], 'discovery')
+        for line in response.body.decode('utf-8', 'replace').splitlines():
+            name, _sep, value = line.partition(':')
+            if name.strip().lower() == 'sitemap' and value.strip():
+                sitemaps.append(urljoin(base_url, value.strip()))
+    except (HTTPError, URLError) as e:
+        log.debug(_('URLLib Error: %s'), e)
+
+    if sitemaps == []:
+        sitemaps = [urljoin(base_url, '/sitemap.xml')]
+    log.info(_('Found %s sitemaps for %s.'), len(sitemaps), site['name'])
+    return sitemaps
+
+
+def get_entries(url, site, fetcher):
+    """
+    """
+
+    log = getLogger(__name__)
+
+    # Feed the parser straight from the connection and throw each entry
+    # away once it's been read, so even a sitemap with 50,000 pages is
+    # never held in memory, either as text or as a tree.
+    log.info(_('Reading: %s'), url)
+    parser = ElementTree.XMLPullParser(events=('end',))
+    try:
+        chunks = fetcher.stream(
+            url, site['short_name'], 'discovery', size_max=SIZE_MAX)
+        for chunk in get_chunks(chunks):
+            parser.feed(chunk)
+            yield from read_entries(parser)
+        parser.close()
+        yield from read_entries(parser)
+    except (HTTPError, URLError) as e:
+        log.debug(_('URLLib Error: %s'), e)
+        log.warning(_('Skipping (could not load): %s'), url)
+    except (ElementTree.ParseError, ValueError, zlib.error) as e:
+        log.warning(_('Skipping the rest of %s: %s'), url, e)
+
+
+def get_chunks(chunks):
+    """
+    """
+
+    # Sitemaps are often served gzipped as files rather than as a transfer
+    # encoding, so unzip them here, to the same limit.
+    chunks = iter(chunks)
+    first = b''
+    for chunk in chunks:
+        first += chunk
+        if len(first) >= 2:
+            break
+    if first[:2] != b'\x1f\x8b':
+        if first:
+            yield first
+        yield from chunks
+        return
+
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    size = 0
+    for chunk in itertools.chain([first], chunks):
+        while chunk:
+            out = decompressor.decompress(chunk, SIZE_MAX - size + 1)
+            size += len(out)
+            if size > SIZE_MAX:
+                raise ValueError(_('Sitemap is over %s bytes.') % SIZE_MAX)
+            yield out
+            chunk = decompressor.unconsumed_tail
+
+
+def read_entries(parser):
+    """
+    """
+
+    for event, element in parser.read_events():
+        tag = get_local_name(element.tag)
+        if tag == SITEMAP or tag in ENTRIES:
+            yield tag, get_fields(element)
+            element.clear()
+
+
+def get_fields(element):
+    """
+    """
+
+    # Flatten the entry into the first value of each field, whatever
+    # namespace it's in. That covers plain sitemaps, news and image sitemap
+    # extensions, RSS and Atom all at once.
+    fields = {}
+    for child in element.iter():
+        if child is element:
+            continue
+        name = get_local_name(child.tag).lower()
+
+        # Atom links are attributes, and an entry can have several.
+        if name == 'link' and child.get('href'):
+            if child.get('rel', 'alternate') != 'alternate':
+                continue
+            value = child.get('href')
+        else:
+            value = ''.join(child.itertext()).strip()
+
+        if value and name not in fields:
+            fields[name] = value
+    return fields
+
+
+def get_local_name(tag):
+    """
+    """
+
+    return tag.rsplit('}', 1)[-1]
+
+
+def get_words(text):
+    """
+    """
+
+    return _NOT_WORDS.sub(' ', text.lower()).strip()
+
+
+def get_title_from_url(url):
+    """
+    """
+
+    # "/2018/03/why-the-humanities-matter/" -> "Why The Humanities Matter"
+    path = unquote(urlsplit(url).path).strip('/')
+    slug = path.rsplit('/', 1)[-1]
+    slug = re.sub(r'\.[a-z0-9]+$', '', slug, flags=re.IGNORECASE)
+    return ' '.join(re.split(r'[-_+]+', slug)).strip().title()
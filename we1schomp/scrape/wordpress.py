@@ -3,22 +3,27 @@
 """
 
 import json
-import random
-import time
+import os
+import threading
 from gettext import gettext as _
 from logging import getLogger
 from urllib.error import HTTPError, URLError
-from urllib.request import urlopen
-from uuid import uuid4
+from urllib.parse import quote
+from uuid import NAMESPACE_URL, uuid4, uuid5
 
 from we1schomp import data
+from we1schomp.article import Article
+from we1schomp.fetch import FetchEngine
 
 
-def check_for_api(site, config):
+def check_for_api(site, config, fetcher=None):
     """
     """
 
     log = getLogger(__name__)
+
+    if fetcher is None:
+        fetcher = FetchEngine(settings=config)
     wp_url = ('http://' + site['url'].strip('/')
               + config['WORDPRESS_API_URL'])
 
@@ -32,8 +37,8 @@ def check_for_api(site, config):
 
     # Check for API access.
     try:
-        with urlopen(wp_url) as result:
-            result = json.loads(result.read())
+        result = json.loads(
+            fetcher.fetch(wp_url, site['short_name'], 'wp_query').body)
         if result['namespace'] != 'wp/v2':
             log.warning(_('Skipping (not found): %s'), wp_url)
             return False
@@ -45,80 +50,208 @@ def check_for_api(site, config):
     return True
 
 
-def get_articles(site, config):
+def get_articles(site, config, fetcher=None):
     """
     """
 
     log = getLogger(__name__)
 
+    if fetcher is None:
+        fetcher = FetchEngine(settings=config)
+
     # Perform the API query.
     log.info(_('Scraping %s from WordPress API.'), site['name'])
     wp_url = ('http://' + site['url'].strip('/')
               + config['WORDPRESS_API_URL'])
-    scrape_results = []
+    sync = get_sync_state(config) if config['WORDPRESS_SYNC_ENABLE'] else None
+    count = 0
 
     for term in site['terms']:
-        json_results = []
 
-        # Sleep for a bit, as a courtesy.
-        sleep_time = random.uniform(
-            config['SLEEP_MIN'], config['SLEEP_MAX'])
-        log.debug(_('Sleeping for %.2f seconds.'), sleep_time)
-        time.sleep(sleep_time)
+        queries = []
 
         # Collect WordPress pages.
         if site['wordpress_enable_pages']:
-            wp_query = config['WORDPRESS_PAGES_QUERY_URL'].format(
-                api_url=wp_url, terms='+'.join(term.split(' ')))
-            log.info(_('Querying: %s'), wp_query)
-            with urlopen(wp_query) as result:
-                json_results += json.loads(result.read())
+            queries.append(config['WORDPRESS_PAGES_QUERY_URL'])
         else:
             log.info(_('Skipping pages (disabled): %s'), site['name'])
 
-        # TODO: Move this into a function
-        sleep_time = random.uniform(
-            config['SLEEP_MIN'], config['SLEEP_MAX'])
-        log.debug(_('log sleep %.2f'), sleep_time)
-        time.sleep(sleep_time)
-
         # Collect WordPress posts.
         if site['wordpress_enable_posts']:
-            wp_query = config['WORDPRESS_POSTS_QUERY_URL'].format(
-                api_url=wp_url, terms='+'.join(term.split(' ')))
-            log.info(_('Querying: %s'), wp_query)
-            with urlopen(wp_query) as result:
-                json_results += json.loads(result.read())
+            queries.append(config['WORDPRESS_POSTS_QUERY_URL'])
         else:
             log.info(_('Skipping posts (disabled): %s'), site['name'])
-        
-        for json_result in json_results:
-            scrape_results.append((json_result, term))
-    
-    if scrape_results == []:
+
+        # Only ask for what's changed since the last time we looked.
+        last_modified = None
+        if sync is not None:
+            last_modified = sync.get(site['short_name'], term)
+            if last_modified is not None:
+                log.info(_('Looking for changes since %s.'), last_modified)
+
+        newest = last_modified
+        failed = []
+        for query in queries:
+            wp_query = query.format(
+                api_url=wp_url, terms='+'.join(term.split(' ')),
+                per_page=config['WORDPRESS_PER_PAGE'],
+                fields=config['WORDPRESS_FIELDS'], page='{page}')
+            if last_modified is not None:
+                wp_query += '&{}={}'.format(
+                    config['WORDPRESS_SYNC_PARAM'], quote(last_modified))
+            for json_result in get_results(wp_query, site, fetcher, failed):
+                count += 1
+                modified = json_result.get('modified')
+                if modified is not None and (
+                        newest is None or modified > newest):
+                    newest = modified
+                yield make_article(json_result, term, site, config, wp_url)
+
+        # If anything went wrong we'd skip those results next time, so
+        # leave the mark where it was.
+        if sync is not None and newest != last_modified:
+            if failed:
+                log.warning(_('Not updating sync mark for "%s" (%s errors).'),
+                            term, len(failed))
+            else:
+                sync.update(site['short_name'], term, newest)
+
+    if count == 0:
         log.warning(_('No API results for %s.'), site['name'])
-        return scrape_results
-
-    # Process the results.
-    for json_result, term in scrape_results:
-        content = data.clean_string(json_result['content']['rendered'])
-        article = {
-            'doc_id': str(uuid4()),
-            'attachment_id': '',
-            'namespace': config['NAMESPACE'],
-            'name': config['DB_NAME'].format(
-                site=site['short_name'],
-                term=data.slugify(term),
-                slug=json_result['slug']),
-            'metapath': config['METAPATH'].format(site=site['short_name']),
-            'pub': site['name'],
-            'pub_short': site['short_name'],
-            'title': data.clean_string(json_result['title']['rendered']),
-            'url': json_result['link'],
-            'content': content,
-            'length': f"{len(content.split(' '))} words",
-            'search_term': term
-        }
-        yield article
 
     log.info(_('Scrape complete.'))
+
+
+def get_results(wp_query, site, fetcher, failed):
+    """
+    """
+
+    log = getLogger(__name__)
+
+    # The first page tells us how many more there are.
+    first_page = wp_query.format(page=1)
+    log.info(_('Querying: %s'), first_page)
+    try:
+        response = fetcher.fetch(first_page, site['short_name'], 'wp_query')
+    except (HTTPError, URLError) as e:
+        log.debug(_('URLLib Error: %s'), e)
+        log.warning(_('Skipping (query failed): %s'), first_page)
+        failed.append(first_page)
+        return
+    yield from json.loads(response.body)
+
+    total_pages = int(response.headers.get('x-wp-totalpages', 1))
+    log.info(_('Found %s results (%s pages).'),
+             response.headers.get('x-wp-total', '?'), total_pages)
+
+    # Grab the rest all at once, a few at a time. Results come back in
+    # whatever order the pages finish downloading.
+    pages = [wp_query.format(page=x) for x in range(2, total_pages + 1)]
+    fetches = fetcher.fetch_all(
+        pages, limit=site['wordpress_concurrency'], site=site['short_name'],
+        stage='wp_query')
+    for page, response, error in fetches:
+        if error is not None:
+            log.debug(_('URLLib Error: %s'), error)
+            log.warning(_('Skipping (query failed): %s'), page)
+            failed.append(page)
+            continue
+        yield from json.loads(response.body)
+
+
+def make_article(json_result, term, site, config, wp_url):
+    """
+    """
+
+    log = getLogger(__name__)
+    index = data.get_index(config)
+    url = json_result['link']
+    title = data.clean_string(json_result['title']['rendered'])
+    content = data.clean_string(json_result['content']['rendered'])
+    pub_date = json_result.get('date', 'N.D.')
+
+    # Give each post the same doc_id every time we see it, whichever term
+    # found it, so a changed post overwrites its old file instead of
+    # turning up twice.
+    if 'id' in json_result:
+        doc_id = str(uuid5(NAMESPACE_URL, '{}#{}'.format(
+            wp_url, json_result['id'])))
+    else:
+        doc_id = str(uuid4())
+
+    # Update whatever we already have for this post in place. That might
+    # be under another doc_id, if it was saved by an older version or came
+    # from a Google search.
+    article = data.load_article(doc_id, config)
+    if article is None and index.find_url(url) is not None:
+        article = data.load_article(index.find_url(url), config)
+
+    if article is None:
+        return Article(
+            doc_id=doc_id, url=url, title=title, pub=site['name'],
+            pub_short=site['short_name'], pub_date=pub_date,
+            search_term=term, search_terms=[term], content=content,
+            slug=json_result['slug'], config=config)
+
+    terms = article.search_terms or [article.search_term]
+    if term not in terms:
+        log.info(_('Duplicate (adding "%s"): %s'), term, url)
+        terms = terms + [term]
+    article.search_terms = terms
+    article.url = url
+    article.title = title
+    article.pub_date = pub_date
+    article.content = content
+    return article
+
+
+class SyncState:
+    """
+    """
+
+    def __init__(self, filename):
+        """
+        """
+
+        self._log = getLogger(__name__)
+        self._lock = threading.Lock()
+
+        self.filename = filename
+        self._marks = {}  # site -> {term -> newest "modified" timestamp}
+        if os.path.exists(filename):
+            with open(filename, 'r', encoding='utf-8') as infile:
+                self._marks = json.load(infile)
+
+    def get(self, site, term):
+        """
+        """
+
+        return self._marks.get(site, {}).get(term)
+
+    def update(self, site, term, modified):
+        """
+        """
+
+        with self._lock:
+            self._marks.setdefault(site, {})[term] = modified
+            temp_filename = self.filename + '.tmp'
+            with open(temp_filename, 'w', encoding='utf-8') as outfile:
+                json.dump(self._marks, outfile, indent=2)
+            os.replace(temp_filename, self.filename)
+        self._log.debug(_('Sync mark for %s "%s": %s'), site, term, modified)
+
+
+_sync_states = {}
+_sync_states_lock = threading.Lock()
+
+
+def get_sync_state(config):
+    """
+    """
+
+    filename = os.path.join(
+        config['OUTPUT_PATH'], config['WORDPRESS_SYNC_FILENAME'])
+    with _sync_states_lock:
+        if filename not in _sync_states:
+            _sync_states[filename] = SyncState(filename)
+        return _sync_states[filename]
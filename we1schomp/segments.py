@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import gzip
+import json
+import os
+import threading
+import zlib
+from gettext import gettext as _
+from logging import getLogger
+from string import Formatter
+
+import regex as re
+
+CHUNK_SIZE = 16 * 1024  # Bytes read at a time when scanning a segment.
+GZIP_MAGIC = b'\x1f\x8b\x08'  # How every gzip member starts.
+
+
+class SegmentStore:
+    """
+    """
+
+    FILENAME = 'we1schomp_{index:05d}.jsonl.gz'
+    SIZE_MAX = 64 * 1024 * 1024  # Bytes before starting a new segment.
+
+    def __init__(self, path, settings=None):
+        """
+        """
+
+        self._log = getLogger(__name__)
+        self._lock = threading.Lock()
+
+        if settings is not None:
+            self.FILENAME = settings['OUTPUT_SEGMENT_FILENAME']
+            self.SIZE_MAX = settings['OUTPUT_SEGMENT_SIZE_MAX']
+
+        # Carry on with the newest segment from last time. If a crash cut
+        # off whatever was being written to it, trim that first, or
+        # everything we add after it would be stuck behind the bad data.
+        self.path = path
+        segments = list_segments(path, self.FILENAME)
+        self._index = segments[-1][0] if segments else 0
+        if segments:
+            repair_segment(os.path.join(path, segments[-1][1]))
+
+    def write(self, article):
+        """
+        """
+
+        # Each article is its own gzip member. Together they're still one
+        # ordinary .jsonl.gz file, but any article can be read back from its
+        # offset alone. A crash can only ever damage the last one, and that's
+        # trimmed off the next time the store is opened.
+        line = json.dumps(article, ensure_ascii=False) + '\n'
+        member = gzip.compress(line.encode('utf-8'))
+
+        with self._lock:
+            filename = self.FILENAME.format(index=self._index)
+            full_filename = os.path.join(self.path, filename)
+            if (os.path.exists(full_filename)
+                    and os.path.getsize(full_filename) >= self.SIZE_MAX):
+                self._index += 1
+                filename = self.FILENAME.format(index=self._index)
+                full_filename = os.path.join(self.path, filename)
+                self._log.info(_('Starting segment: %s'), filename)
+
+            with open(full_filename, 'ab') as outfile:
+                offset = outfile.tell()
+                outfile.write(member)
+
+        return filename, offset
+
+
+def read_article(filename, offset):
+    """
+    """
+
+    # Read just the one gzip member that starts at this offset.
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    parts = []
+    with open(filename, 'rb') as infile:
+        infile.seek(offset)
+        while not decompressor.eof:
+            chunk = infile.read(CHUNK_SIZE)
+            if not chunk:
+                raise EOFError(_('Truncated segment: %s') % filename)
+            parts.append(decompressor.decompress(chunk))
+    return json.loads(b''.join(parts).decode('utf-8'))
+
+
+def read_segment(filename):
+    """
+    """
+
+    log = getLogger(__name__)
+
+    # Yields (offset, article) for every article in the segment, including
+    # older copies of ones that were saved again later.
+    for offset, length, data in _read_members(filename):
+        try:
+            yield offset, json.loads(data.decode('utf-8'))
+        except ValueError as e:
+            log.warning(_('Bad segment data in %s at %s: %s'),
+                        filename, offset, e)
+
+
+def repair_segment(filename):
+    """
+    """
+
+    log = getLogger(__name__)
+
+    # Cut the file off after the last article that reads back whole.
+    end = 0
+    for offset, length, data in _read_members(filename):
+        end = offset + length
+    size = os.path.getsize(filename)
+    if size > end:
+        log.warning(_('Trimming %s bad bytes from the end of %s.'),
+                    size - end, filename)
+        with open(filename, 'r+b') as outfile:
+            outfile.truncate(end)
+    return size - end
+
+
+def _read_members(filename):
+    """
+    """
+
+    log = getLogger(__name__)
+
+    # Yields (offset, length, data) for every gzip member that reads back
+    # whole. A damaged one is skipped by looking for where the next one
+    # starts, so one bad article doesn't take the rest of the file with it.
+    with open(filename, 'rb') as infile:
+        offset = 0
+        buffer = b''  # What we've read so far, starting at offset.
+        while True:
+            if not buffer:
+                buffer = infile.read(CHUNK_SIZE)
+                if not buffer:
+                    return
+
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            parts = []
+            fed = 0
+            try:
+                while not decompressor.eof:
+                    if fed == len(buffer):
+                        chunk = infile.read(CHUNK_SIZE)
+                        if not chunk:
+                            raise EOFError(_('Truncated segment'))
+                        buffer += chunk
+                    parts.append(decompressor.decompress(buffer[fed:]))
+                    fed = len(buffer)
+            except (EOFError, zlib.error) as e:
+                log.warning(_('Bad segment data in %s at %s: %s'),
+                            filename, offset, e)
+                buffer += infile.read()
+                skip = buffer.find(GZIP_MAGIC, 1)
+                if skip == -1:
+                    return
+                offset += skip
+                buffer = buffer[skip:]
+                continue
+
+            length = len(buffer) - len(decompressor.unused_data)
+            yield offset, length, b''.join(parts)
+            offset += length
+            buffer = buffer[length:]
+
+
+def list_segments(path, filename_format):
+    """
+    """
+
+    # Segments in the order they were written, as (index, filename).
+    pattern = get_filename_pattern(filename_format)
+    segments = []
+    for filename in os.listdir(path):
+        match = pattern.match(filename)
+        if match is not None:
+            segments.append((int(match.group('index')), filename))
+    return sorted(segments)
+
+
+def get_filename_pattern(filename_format):
+    """
+    """
+
+    # Turn something like "we1schomp_{site}_{term}_{timestamp}_{index}.json"
+    # into a regex so we can pull the index back out of existing filenames.
+    pattern = ''
+    for literal, field, spec, conversion in Formatter().parse(filename_format):
+        pattern += re.escape(literal)
+        if field == 'index':
+            pattern += r'(?P<index>\d+)'
+        elif field is not None:
+            pattern += '.*?'
+    return re.compile(pattern + '$')
@@ -7,6 +7,8 @@ import os
 from configparser import SafeConfigParser
 from gettext import gettext as _
 
+from we1schomp.stopwords import StopwordMatcher
+
 
 def from_ini(filename):
     """
@@ -42,6 +44,12 @@ def get_settings(config):
         'NAMESPACE': config['namespace'],
         'OUTPUT_FILENAME': config['outputFilename'],
         'OUTPUT_PATH': config['outputPath'],
+        'OUTPUT_INDEX_FILENAME': config['outputIndexFilename'],
+        'OUTPUT_FORMAT': config['outputFormat'].strip().lower(),
+        'OUTPUT_SEGMENT_FILENAME': config['outputSegmentFilename'],
+        'OUTPUT_SEGMENT_SIZE_MAX':
+            config.getint('outputSegmentSizeMaxMB') * 1024 * 1024,
+        'STATE_FILENAME': config['stateFilename'],
         'PAUSE_ON_EXIT': config.getboolean('pauseOnExit'),
 
         # Browser settings
@@ -51,14 +59,67 @@ def get_settings(config):
         'SLEEP_MAX':
             max([config.getfloat('browserSleepMin'),
                  config.getfloat('browserSleepMax')]),
-        
+        'BROWSER_POOL_SIZE': config.getint('browserPoolSize'),
+        'BROWSER_POOL_PAGES_MAX': config.getint('browserPoolPagesMax'),
+
+        # HTTP settings
+        'HTTP_TIMEOUT': config.getfloat('httpTimeout'),
+        'HTTP_USER_AGENT': config['httpUserAgent'],
+        'HTTP_POOL_SIZE': config.getint('httpPoolSize'),
+        'HTTP_SIZE_MAX': config.getint('httpSizeMaxMB') * 1024 * 1024,
+
+        # Fetch settings
+        'FETCH_CONCURRENCY': config.getint('fetchConcurrency'),
+        'FETCH_ATTEMPTS_MAX': config.getint('fetchAttemptsMax'),
+        'FETCH_CONCURRENCY_PER_HOST': config.getint('fetchConcurrencyPerHost'),
+
+        # Rate limiter settings
+        'RATE_FILENAME': config['rateFilename'],
+        'RATE_DELAY_START': config.getfloat('rateDelayStart'),
+        'RATE_DELAY_MIN': config.getfloat('rateDelayMin'),
+        'RATE_DELAY_MAX':
+            max([config.getfloat('rateDelayMin'),
+                 config.getfloat('rateDelayMax')]),
+        'RATE_SLOW_RESPONSE': config.getfloat('rateSlowResponse'),
+
+        # Cache settings
+        'CACHE_ENABLE': config.getboolean('cacheEnable'),
+        'CACHE_PATH': config['cachePath'],
+        'CACHE_SIZE_MAX': config.getint('cacheSizeMaxMB') * 1024 * 1024,
+        'CACHE_OFFLINE': config.getboolean('cacheOffline'),
+
+        # Duplicate settings
+        'DEDUPE_ENABLE': config.getboolean('dedupeEnable'),
+        'DEDUPE_FILENAME': config['dedupeFilename'],
+        'DEDUPE_SIMILARITY': config.getfloat('dedupeSimilarity'),
+        'DEDUPE_ACTION': config['dedupeAction'].strip().lower(),
+        'DEDUPE_LENGTH_MIN': config.getint('dedupeLengthMin'),
+
+        # Corpus database settings
+        'CORPUS_ENABLE': config.getboolean('corpusEnable'),
+        'CORPUS_FILENAME': config['corpusFilename'],
+
+        # Metrics settings
+        'METRICS_PROMETHEUS_FILE': config['metricsPrometheusFile'],
+        'METRICS_JSON_FILE': config['metricsJsonFile'],
+        'METRICS_INTERVAL': config.getfloat('metricsInterval'),
+
         # Scrape settings
         'WORDPRESS_ENABLE': config.getboolean('wpEnable'),
         'WORDPRESS_API_URL': config['wpApiUrl'],
         'WORDPRESS_PAGES_QUERY_URL': config['wpPagesQueryUrl'],
         'WORDPRESS_POSTS_QUERY_URL': config['wpPostsQueryUrl'],
+        'WORDPRESS_PER_PAGE': config.getint('wpPerPage'),
+        'WORDPRESS_FIELDS': config['wpFields'],
+        'WORDPRESS_SYNC_ENABLE': config.getboolean('wpSyncEnable'),
+        'WORDPRESS_SYNC_FILENAME': config['wpSyncFilename'],
+        'WORDPRESS_SYNC_PARAM': config['wpSyncParam'],
         'GOOGLE_ENABLE': config.getboolean('googleEnable'),
         'GOOGLE_QUERY_URL': config['googleQueryUrl'],
+        'GOOGLE_RESULTS_PER_PAGE': config.getint('googleResultsPerPage'),
+        'GOOGLE_STOP_ON_KNOWN': config.getboolean('googleStopOnKnown'),
+        'HTML_PARSER': config['htmlParser'],
+        'HTML_PARSER_FALLBACK': config['htmlParserFallback'],
     }
 
     return settings
@@ -86,6 +147,10 @@ def get_sites(config):
         # Split comma-separated values into Python lists.
         terms = site['terms'].strip(',').split(',')
         google_stopwords = site['googleStopwords'].strip(',').split(',')
+        sitemap_urls = [x.strip() for x in site['sitemapUrls'].split(',')
+                        if x.strip()]
+        feed_urls = [x.strip() for x in site['feedUrls'].split(',')
+                     if x.strip()]
         
         site = {
             # Basic metadata
@@ -96,12 +161,22 @@ def get_sites(config):
             'wordpress_enable': site.getboolean('wpEnable'),
             'wordpress_enable_pages': site.getboolean('wpGetPages'),
             'wordpress_enable_posts': site.getboolean('wpGetPosts'),
+            'wordpress_concurrency': site.getint('wpConcurrency'),
 
             # Google scrape settings
             'google_enable': site.getboolean('googleEnable'),
             'google_stopwords': google_stopwords,
+            'stopwords': StopwordMatcher(google_stopwords),
             'content_tag': site['googleScrapeContentTag'],
-            'content_length_min': site.getint('googleScrapeContentLengthMin')
+            'content_length_min': site.getint('googleScrapeContentLengthMin'),
+            'html_parser': site['htmlParser'],
+            'html_parser_fallback': site['htmlParserFallback'],
+
+            # Where to find URLs: "google" searches, or "sitemap" to read
+            # the site's own sitemaps and feeds instead.
+            'discovery': site['discovery'].strip().lower(),
+            'sitemap_urls': sitemap_urls,
+            'feed_urls': feed_urls
         }
 
         log.info(_('Loaded: %s'), name)
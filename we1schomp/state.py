@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import sqlite3
+import threading
+import time
+from gettext import gettext as _
+from logging import getLogger
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS serp (
+    site TEXT NOT NULL,
+    term TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    updated REAL NOT NULL,
+    PRIMARY KEY (site, term)
+);
+CREATE TABLE IF NOT EXISTS fetch (
+    url TEXT PRIMARY KEY,
+    site TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    updated REAL NOT NULL
+);
+'''
+
+
+class CrawlState:
+    """
+    """
+
+    def __init__(self, filename):
+        """
+        """
+
+        self._log = getLogger(__name__)
+        self._lock = threading.Lock()
+
+        # Every change is committed straight away, so whatever's in here is
+        # exactly where we were when the run stopped.
+        self.filename = filename
+        self._db = sqlite3.connect(
+            filename, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(SCHEMA)
+
+    def reset(self):
+        """
+        """
+
+        self._log.debug(_('Clearing crawl state: %s'), self.filename)
+        with self._lock:
+            self._db.execute('DELETE FROM serp')
+            self._db.execute('DELETE FROM fetch')
+
+    def get_serp(self, site, term):
+        """
+        """
+
+        with self._lock:
+            row = self._db.execute(
+                'SELECT page, url, done FROM serp WHERE site = ? AND term = ?',
+                (site, term)).fetchone()
+        if row is None:
+            return None
+        return {'page': row[0], 'url': row[1], 'done': bool(row[2])}
+
+    def set_serp(self, site, term, page, url, done=False):
+        """
+        """
+
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO serp VALUES (?, ?, ?, ?, ?, ?)',
+                (site, term, page, url, int(done), time.time()))
+
+    def get_attempts(self, url):
+        """
+        """
+
+        with self._lock:
+            row = self._db.execute(
+                'SELECT attempts FROM fetch WHERE url = ?', (url,)).fetchone()
+        return 0 if row is None else row[0]
+
+    def start_fetch(self, url, site):
+        """
+        """
+
+        # Count the try before it happens, so a page that hangs the run or
+        # takes the whole thing down still uses up one of its attempts.
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE fetch SET status = 'started', "
+                'attempts = attempts + 1, updated = ? WHERE url = ?',
+                (now, url))
+            if cursor.rowcount == 0:
+                self._db.execute(
+                    "INSERT INTO fetch VALUES (?, ?, 'started', 1, NULL, ?)",
+                    (url, site, now))
+
+    def set_fetch(self, url, site, status, error=None):
+        """
+        """
+
+        # How it went. The attempt itself was counted by start_fetch.
+        error = None if error is None else str(error)
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                'UPDATE fetch SET status = ?, last_error = ?, updated = ? '
+                'WHERE url = ?', (status, error, now, url))
+            if cursor.rowcount == 0:
+                self._db.execute(
+                    'INSERT INTO fetch VALUES (?, ?, ?, 1, ?, ?)',
+                    (url, site, status, error, now))
+
+    def close(self):
+        """
+        """
+
+        with self._lock:
+            self._db.close()
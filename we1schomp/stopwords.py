@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+from urllib.parse import urlsplit
+
+import regex as re
+
+# Stopwords normally match anywhere in the URL. These prefixes tie them to
+# the URL's path instead, e.g. "prefix:/tag", "suffix:/print", "ext:pdf".
+PREFIX = 'prefix:'
+SUFFIX = 'suffix:'
+EXTENSION = 'ext:'
+
+
+class StopwordMatcher:
+    """
+    """
+
+    def __init__(self, stopwords):
+        """
+        """
+
+        self.stopwords = [x.strip().lower() for x in stopwords if x.strip()]
+
+        anywhere, path = [], []
+        for stop in self.stopwords:
+            if stop.startswith(PREFIX):
+                path.append((stop, '^' + re.escape(stop[len(PREFIX):])))
+            elif stop.startswith(SUFFIX):
+                path.append((stop, re.escape(stop[len(SUFFIX):]) + '$'))
+            elif stop.startswith(EXTENSION):
+                extension = stop[len(EXTENSION):].lstrip('.')
+                path.append((stop, r'\.' + re.escape(extension) + '$'))
+            else:
+                anywhere.append((stop, re.escape(stop)))
+
+        # Name each alternative after its stopword so we can say which one
+        # matched without checking them one at a time.
+        self._names = {}
+        self._anywhere = self._compile(anywhere)
+        self._path = self._compile(path)
+
+    def match(self, url):
+        """
+        """
+
+        url = url.lower()
+        for pattern, text in ((self._anywhere, url),
+                              (self._path, self._get_path(url))):
+            if pattern is None:
+                continue
+            found = pattern.search(text)
+            if found is not None:
+                return self._names[found.lastgroup]
+        return None
+
+    def _compile(self, patterns):
+        """
+        """
+
+        if patterns == []:
+            return None
+
+        groups = []
+        for stop, pattern in patterns:
+            name = 's{}'.format(len(self._names))
+            self._names[name] = stop
+            groups.append('(?P<{}>{})'.format(name, pattern))
+        return re.compile('|'.join(groups))
+
+    @staticmethod
+    def _get_path(url):
+        """
+        """
+
+        if '//' not in url:
+            url = '//' + url
+        return urlsplit(url).path
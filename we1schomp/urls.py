@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+from urllib.parse import parse_qsl, quote, unquote, urlencode, urlsplit
+
+# Query parameters that only track where a click came from. The same page
+# turns up with all sorts of these attached.
+TRACKING_PARAMS = ['_ga', 'cmpid', 'dclid', 'fbclid', 'gclid', 'mc_cid',
+                   'mc_eid', 'ncid']
+TRACKING_PREFIXES = ['utm_']
+
+DEFAULT_PORTS = {'http': '80', 'https': '443'}
+
+
+def canonical_url(url):
+    """
+    """
+
+    # Sometimes Google hands us URLs with no scheme at all.
+    url = url.strip()
+    if '//' not in url:
+        url = '//' + url
+    parts = urlsplit(url)
+
+    # http vs. https and www vs. no www almost never mean different pages,
+    # so leave them out altogether.
+    host = parts.hostname or ''
+    if host.startswith('www.'):
+        host = host[len('www.'):]
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port is not None and str(port) != DEFAULT_PORTS.get(parts.scheme):
+        host += ':{}'.format(port)
+
+    # Tidy up the path: decode anything that didn't need encoding in the
+    # first place, and drop trailing slashes and index pages.
+    path = quote(unquote(parts.path), safe='/:@!$&\'()*+,;=~')
+    for index_page in ('/index.html', '/index.htm', '/index.php'):
+        if path.endswith(index_page):
+            path = path[:-len(index_page)]
+    path = path.rstrip('/')
+
+    # Keep the query (WordPress "?p=123" links need it), but throw out
+    # tracking junk and put what's left in a consistent order.
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if not is_tracking_param(k)]
+    query = urlencode(sorted(query))
+
+    # Fragments never reach the server, so they can't be different pages.
+    canonical = host + path
+    if query:
+        canonical += '?' + query
+    return canonical
+
+
+def is_tracking_param(name):
+    """
+    """
+
+    name = name.lower()
+    return (name in TRACKING_PARAMS
+            or any(name.startswith(x) for x in TRACKING_PREFIXES))